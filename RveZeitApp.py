@@ -9,11 +9,15 @@ import RveZeitConfig
 import RveZeitUI
 import RveZeitDB
 import RveZeitFtp
+import RveZeitReplication
+import RveZeitExport
+import RveZeitClock
+import RveZeitCore
 
 import time
-import math
+import bisect
 import tkinter as tk
-from tkinter import messagebox, ttk
+from tkinter import messagebox, simpledialog, ttk
 
 
 class App:
@@ -23,18 +27,42 @@ class App:
     __config: RveZeitConfig = None
     __ui: RveZeitUI = None
     __changeNr = None
-    __transport = None
+    __core: RveZeitCore = None
     __styles = {}
-
-    def __init__(self, config: RveZeitConfig, ui: RveZeitUI, db: RveZeitDB, transport: RveZeitFtp):
+    # sorted keys (-secToday, nummer) of the lines in the listbox, same order as the listbox
+    __timeline = []
+    # nummer -> key in __timeline
+    __timelineKeys = {}
+    # capture clock, anchored to the wall clock at startup and after clock steps
+    __clock = None
+    # id of the scheduled auto sync, None if AutoSyncInterval is 0
+    __autoSyncId = None
+    # captures taken in the key handler, persisted after the handler returned
+    __pendingCaptures = []
+    # (race_id, name) of all races, in the order of the race selector
+    __races = []
+
+    def __init__(self, config: RveZeitConfig, ui: RveZeitUI, db: RveZeitDB, transport: RveZeitFtp,
+                 replication: RveZeitReplication = None):
         """
         No idea what will be done here.
         """
         self.__config = config
         self.__ui = ui
         self.__db = db
-        self.__transport = transport
-
+        # capture, export and transfer, shared with the headless mode
+        self.__core = RveZeitCore.Core(config, db, transport, replication)
+        self.__core.setTransferHandlers(done=self.__transferDone, progress=self.__transferProgress)
+        # station whose replicated times are the start of the elapsed times in the list
+        self.__elapsedFrom = None
+        self.__configReloaded({"replication.ElapsedFrom"})
+        config.onReload(self.__configReloaded)
+        db.onWriteError(self.__writeFailed)
+        self.__pendingCaptures = []
+        # style state ("default", "green", "red") currently shown per input group
+        self.__entryStates = {}
+
+        self.__clock = RveZeitClock.Clock()
         maxNumber = db.getMaxNumber()
 
         # Create Styles
@@ -54,10 +82,48 @@ class App:
             "redEntry": 'red.TEntry'
         }
 
+        # live duplicate check while typing
+        ui.trace("window.text1", self.check_1)
+        ui.trace("window.text2", self.check_2)
+        ui.trace("window.text3", self.check_3)
+
+        # activate buttons etc
+        if self.__config.get("data.AutoIncrement"):
+            ui.insert("window.text1", 0, str(maxNumber+1))
+        ui.config("window.btnCheck1", command=self.check_1)
+        ui.config("window.btnCommit1", command=self.zeitOf1)
+        ui.config("window.btnCheck2", command=self.check_2)
+        ui.config("window.btnCommit2", command=self.zeitOf2)
+        ui.config("window.btnCheck3", command=self.check_3)
+        ui.config("window.btnCommit3", command=self.zeitOf3)
+
+        # activate key actions
+        ui.bind("window", "s", self.zeitOf1)
+        ui.bind("window", "d", self.zeitOf2)
+        ui.bind("window", "f", self.zeitOf3)
+        ui.bind("window.text1", "<Return>", self.zeitOf1)
+        ui.bind("window.text2", "<Return>", self.zeitOf2)
+        ui.bind("window.text3", "<Return>", self.zeitOf3)
+        ui.bind("window", "q", lambda event: self.exit())
+        ui.bind("window", "a", lambda event: self.show_about())
+        ui.bind("window", "t", lambda event: self.sendFile())
+        ui.bind("window", "<Control-r>", lambda event: self.__config.reload())
+
+        # list, change, menus and logo are built after the first frame
+        ui.whenBuilt(self.__initLazy)
+
+    def __initLazy(self):
+        """
+        Activate the lazy elements of the UI, see RveZeitConfig.
+        """
+        ui = self.__ui
+
         # activate menues
         ui.config_menu("window.rootMenu.fileMenu", 0, command=self.sendFile)
         ui.config_menu("window.rootMenu.fileMenu", 2, command=self.exit)
         ui.config_menu("window.rootMenu.helpMenu", 0, command=self.show_about)
+        # closing the window stores the captures the same way as the menu
+        ui.onClose(self.exit)
 
         # activate scrollbar in listbox
         scrollbar = ui.getWidget("window.frmEntryList.frmEntryListScrollbar")
@@ -66,15 +132,6 @@ class App:
             listbox.config(yscrollcommand=scrollbar.set)
             scrollbar.config(command=listbox.yview)
 
-        # activate buttons etc
-        if self.__config.get("data.AutoIncrement"):
-            ui.insert("window.text1", 0, str(maxNumber+1))
-        ui.config("window.btnCheck1", command=self.check_1)
-        ui.config("window.btnCommit1", command=self.zeitOf1)
-        ui.config("window.btnCheck2", command=self.check_2)
-        ui.config("window.btnCommit2", command=self.zeitOf2)
-        ui.config("window.btnCheck3", command=self.check_3)
-        ui.config("window.btnCommit3", command=self.zeitOf3)
         ui.config("window.btnUpdateList", command=self.refeshList)
         ui.config("window.btnChangeGet", command=self.get4Modification)
         ui.config("window.btnChangeSave", command=self.changeTime)
@@ -82,16 +139,10 @@ class App:
         ui.config("window.btnSaveLocal", command=self.writeLocalTrzFile)
         ui.config("window.btnTransfere", command=self.sendFile)
 
-        # activate key actions
-        ui.bind("window", "s", lambda event: self.zeitOf1())
-        ui.bind("window", "d", lambda event: self.zeitOf2())
-        ui.bind("window", "f", lambda event: self.zeitOf3())
-        ui.bind("window.text1", "<Return>", lambda event: self.zeitOf1())
-        ui.bind("window.text2", "<Return>", lambda event: self.zeitOf2())
-        ui.bind("window.text3", "<Return>", lambda event: self.zeitOf3())
-        ui.bind("window", "q", lambda event: self.exit())
-        ui.bind("window", "a", lambda event: self.show_about())
-        ui.bind("window", "t", lambda event: self.sendFile())
+        # race selector
+        ui.bind("window.cmbRace", "<<ComboboxSelected>>", lambda event: self.__raceSelected())
+        ui.config("window.btnNewRace", command=self.newRace)
+        self.__showRaces()
 
         # add picture
         logoFile = self.__config.get("app.logo")
@@ -112,16 +163,65 @@ class App:
         else:
             self.__autoValue.set(0)
 
+    def __configReloaded(self, changed: set):
+        """
+        Apply changed configuration values which are kept in the App.
+        """
+        if "replication.ElapsedFrom" in changed or "data.Position" in changed:
+            self.__elapsedFrom = self.__config.replication.ElapsedFrom
+            if self.__elapsedFrom == self.__config.data.Position:
+                self.__elapsedFrom = None
+        if "data.TimeDecimals" in changed or "replication.ElapsedFrom" in changed:
+            if self.__timelineKeys:
+                self.refeshList()
+        if "ftp.AutoSyncInterval" in changed:
+            self.__scheduleAutoSync()
+
+    def __writeFailed(self, message: str):
+        """
+        A capture or change could not be stored, the list shows the stored state again.
+        """
+        messagebox.showerror(title="Datenbank", message=f"Nicht gespeichert:\n{message}")
+
     def start(self):
         self.__clocktime()
+        self.__pollBackground()
+        self.__scheduleAutoSync()
+
+    def __pollBackground(self):
+        """
+        Handle the acknowledgements of the database writes (write-behind mode)
+        and the progress of background file transfers.
+        Replicated times of the start station update the elapsed times in the list.
+        """
+        changed = self.__core.processEvents()
+        for nummer in changed.get(self.__elapsedFrom, ()):
+            if nummer in self.__timelineKeys:
+                self.__updateListEntry(nummer)
+        self.__ui.after("window", 50, self.__pollBackground)
+
+    def __formatTime(self, secToday: float, decimals: int = None) -> str:
+        """
+        Format seconds of the day as HH:MM:SS with the configured number of decimals.
+        Decimals are truncated, not rounded.
+        """
+        if decimals is None:
+            decimals = self.__config.data.TimeDecimals or 0
+        return RveZeitExport.formatTime(secToday, decimals)
 
     def __clocktime(self):
         """
         This function is used to
         display time on the label
         """
-        string = time.strftime('%H:%M:%S')
+        # the label shows the capture clock, which follows steps of the wall clock
+        self.__clock.check()
+        string = RveZeitExport.formatTime(self.__clock.secToday())
         self.__ui.config("window.lblClock", text=string)
+        lastSync = self.__core.getLastSync()
+        if lastSync is not None and not self.__core.isTransferRunning():
+            age = int(time.monotonic() - lastSync)
+            self.__ui.config("window.lblTransfer", text=f"Sync vor {age // 60}:{str(age % 60).zfill(2)} min")
         self.__ui.after("window.lblClock", 500, self.__clocktime)
 
     # ========================================================================
@@ -143,75 +243,172 @@ class App:
         self.__checkNumber(3)
 
     def __checkNumber(self, nummer: int):
+        """
+        Mark the input group green if the number is new, red if it is already stored.
+        Called on every change of the entry, so it only uses the in-memory index of the database.
+        """
         nostr = self.__ui.getValue(f"window.text{nummer}")
-        if len(nostr) > 0:
-            row = self.__db.getDataByNumber(nostr)
-            if row is None:
-                self.__ui.config(f"window.btnCommit{nummer}", style=self.__styles["greenButton"])
-                self.__ui.config(f"window.text{nummer}", style=self.__styles["greenEntry"])
-            else:
-                self.__ui.config(f"window.btnCommit{nummer}", style=self.__styles["redButton"])
-                self.__ui.config(f"window.text{nummer}", style=self.__styles["redEntry"])
+        if not nostr:
+            self.__markEntry(nummer, "default")
+        elif not self.__db.hasNumber(nostr):
+            self.__markEntry(nummer, "green")
+        else:
+            self.__markEntry(nummer, "red")
+
+    def __markEntry(self, nummer: int, state: str):
+        """
+        Set the style of entry and commit button of an input group, if it is not already set.
+        """
+        if self.__entryStates.get(nummer) != state:
+            self.__entryStates[nummer] = state
+            self.__ui.config(f"window.btnCommit{nummer}", style=self.__styles[f"{state}Button"])
+            self.__ui.config(f"window.text{nummer}", style=self.__styles[f"{state}Entry"])
 
     # ============================================================================================
-    def zeitOf1(self):
-        self.__speichereZeit(1)
+    def zeitOf1(self, event=None):
+        self.__speichereZeit(1, event)
 
-    def zeitOf2(self):
-        self.__speichereZeit(2)
+    def zeitOf2(self, event=None):
+        self.__speichereZeit(2, event)
 
-    def zeitOf3(self):
-        self.__speichereZeit(3)
+    def zeitOf3(self, event=None):
+        self.__speichereZeit(3, event)
 
-    def __speichereZeit(self, nummer: int):
+    def __speichereZeit(self, nummer: int, event=None):
         """
-        speichert die Bootsnummer und die aktuelle Zeit in der Datenbank.
+        speichert die Bootsnummer und die Zeit des Tastendrucks in der Datenbank.
+        The time is taken from the event first. Writing to the database and updating
+        the list is queued and done after the handler returned.
         """
-        jetzt = time.localtime()
-        timeString = str(jetzt.tm_hour).zfill(2) + ":" + str(jetzt.tm_min).zfill(2) + ":" + str(jetzt.tm_sec).zfill(2)
-        secToday = 3600*jetzt.tm_hour + 60*jetzt.tm_min + jetzt.tm_sec
+        secToday = self.__clock.eventSecToday(getattr(event, "time", None))
         nostr = self.__ui.getValue(f"window.text{nummer}")
         if not nostr is None and len(nostr) > 0:
-            self.__db.upsertDataByNumber(nostr, timeString, jetzt.tm_hour, jetzt.tm_min, jetzt.tm_sec, secToday)
+            if not self.__pendingCaptures:
+                self.__ui.after("window", 0, self.__persistCaptures)
+            self.__pendingCaptures.append((nostr, secToday))
 
-            if self.__config.get("data.AutoIncrement"):
+            # the changed entry is checked again by its trace
+            if self.__config.data.AutoIncrement:
                 self.__ui.replace(f"window.text{nummer}", str(int(nostr)+1))
             else:
                 self.__ui.clear(f"window.text{nummer}")
-
-            self.__ui.config(f"window.btnCommit{nummer}", style=self.__styles["defaultButton"])
-            self.__ui.config(f"window.text{nummer}", style=self.__styles["defaultEntry"])
-            self.refeshList()
         else:
-            if self.__config.get("data.AutoIncrement"):
+            if self.__config.data.AutoIncrement:
                 self.__ui.replace(f"window.text{nummer}", "0")
 
-            self.__ui.config(f"window.btnCommit{nummer}", style=self.__styles["redButton"])
-            self.__ui.config(f"window.text{nummer}", style=self.__styles["redEntry"])
+            self.__markEntry(nummer, "red")
+
+    def __persistCaptures(self):
+        """
+        Write the queued captures to the database and patch them into the list.
+        """
+        pending = self.__pendingCaptures
+        self.__pendingCaptures = []
+        for nostr, secToday in pending:
+            self.__core.capture(nostr, secToday, callback=lambda n=int(nostr): self.__updateListEntry(n))
 
     # ========================================================================
     def refeshList(self):
         """
-        Update liste der vorhandenen nummern
+        Update liste der vorhandenen nummern.
+        Complete rebuild of the list, only used on startup and by the Update button.
         """
         # print("refeshList....")
         self.__ui.clear("window.frmEntryList.frmEntryListBox")
-        data = self.__db.getAllData()
-        for satz in data:
-            # listbox:
-            line = f"{satz[1]}    {str(satz[0]).zfill(4)}"
-            if satz[6] != 0:
-                line = f"{line} (korrigiert)"
-            self.__ui.insert("window.frmEntryList.frmEntryListBox", tk.END, line)
+        self.__timeline = []
+        self.__timelineKeys = {}
+        for satz in self.__db.iterAllData():
+            key = (-satz[5], satz[0])
+            self.__timeline.append(key)
+            self.__timelineKeys[satz[0]] = key
+            self.__ui.insert("window.frmEntryList.frmEntryListBox", tk.END, (self.__formatListLine(satz), satz[0]))
+
+    def __updateListEntry(self, nummer: int):
+        """
+        Patch a single number into the list at its sorted position.
+        Removes the old line of the number and inserts the current database row if present.
+        """
+        self.__removeListEntry(nummer)
+        satz = self.__db.getDataByNumber(nummer)
+        if satz:
+            key = (-satz[5], satz[0])
+            index = bisect.bisect_left(self.__timeline, key)
+            self.__timeline.insert(index, key)
+            self.__timelineKeys[satz[0]] = key
+            self.__ui.insert("window.frmEntryList.frmEntryListBox", index, (self.__formatListLine(satz), satz[0]))
+
+    def __removeListEntry(self, nummer: int):
+        """
+        Remove the line of the given number from the list.
+        """
+        key = self.__timelineKeys.pop(nummer, None)
+        if key is not None:
+            index = bisect.bisect_left(self.__timeline, key)
+            if index < len(self.__timeline) and self.__timeline[index] == key:
+                del self.__timeline[index]
+                self.__ui.delete("window.frmEntryList.frmEntryListBox", index)
+
+    def __formatListLine(self, satz) -> str:
+        """
+        Format a database row as line for the list.
+        """
+        line = f"{self.__formatTime(satz[5])}    {str(satz[0]).zfill(4)}"
+        if self.__elapsedFrom:
+            start = self.__db.getMirrorTime(self.__elapsedFrom, satz[0])
+            if start is not None:
+                line = f"{line}  +{self.__formatTime((satz[5] - start) % 86400)}"
+        if satz[6] != 0:
+            line = f"{line} (korrigiert)"
+        return line
+
+    # == races ===============================================================
+    def __showRaces(self):
+        """
+        Fill the race selector, the current race is selected.
+        """
+        self.__races = self.__db.getRaces()
+        self.__ui.setValues("window.cmbRace", [f"{race} {name}" for race, name in self.__races])
+        for race, name in self.__races:
+            if race == self.__db.getRace():
+                self.__ui.getWidget("window.cmbRace").set(f"{race} {name}")
+
+    def __raceSelected(self):
+        value = self.__ui.getValue("window.cmbRace")
+        if value:
+            self.__selectRace(int(value.split()[0]))
+
+    def newRace(self):
+        """
+        Create a new race and switch to it.
+        """
+        name = simpledialog.askstring("Neues Rennen", "Name des Rennens:",
+                                      initialvalue=f"Rennen {len(self.__races) + 1}")
+        if name:
+            self.__selectRace(self.__db.addRace(name))
+            self.__showRaces()
+
+    def __selectRace(self, race: int):
+        """
+        Switch list, captures and exports to the race. The next transfer is a complete snapshot.
+        """
+        if race is None or race == self.__db.getRace():
+            return
+        self.__persistCaptures()
+        self.__core.selectRace(race)
+        self.refeshList()
+        if self.__config.data.AutoIncrement:
+            self.__ui.replace("window.text1", str(self.__db.getMaxNumber() + 1))
+        self.check_1()
+        self.check_2()
+        self.check_3()
 
     # ========================================================================
     def get4Modification(self):
         """
         Load selected entry from list into fields for editing.
         """
-        entryText = self.__ui.curselection("window.frmEntryList.frmEntryListBox")
-        if entryText:
-            Nummer = entryText[12:16]
+        Nummer = self.__ui.curvalue("window.frmEntryList.frmEntryListBox")
+        if Nummer is not None:
             self.__changeNr = int(Nummer)
             TRZtext = f"Change #{self.__changeNr}"
             self.__ui.config("window.lblChangeText", text=TRZtext)
@@ -220,18 +417,11 @@ class App:
                 self.__ui.replace("window.editH", str(row[2]).zfill(2))
                 self.__ui.replace("window.editM", str(row[3]).zfill(2))
                 self.__ui.replace("window.editS", str(row[4]).zfill(2))
-                myOLD = row[1]
+                myOLD = self.__formatTime(row[5])
                 if row[6] > 0:
-                    oldH = math.floor(row[6] / 3600)
-                    oldM = math.floor((row[6] - 3600 * oldH) / 60)
-                    oldS = row[6] - 3600 * oldH - 60 * oldM
-                    myOLD = myOLD + " (" + str(oldH).zfill(2) + ":" + str(oldM).zfill(2) + ":" + str(oldS).zfill(2)
+                    myOLD = myOLD + " (" + self.__formatTime(row[6])
                     if row[7] > 0:
-                        oldH = math.floor(row[7] / 3600)
-                        oldM = math.floor((row[7] - 3600 * oldH) / 60)
-                        oldS = row[7] - 3600 * oldH - 60 * oldM
-                        myOLD = myOLD + " und " + str(oldH).zfill(2) + ":" + str(oldM).zfill(2)
-                        + ":" + str(oldS).zfill(2)
+                        myOLD = myOLD + " und " + self.__formatTime(row[7])
                     myOLD = myOLD + ")"
                 else:
                     myOLD = myOLD + " <=  alte Zeit"
@@ -247,8 +437,6 @@ class App:
             if row:
                 print(f"Change row: {row}")
                 backup0 = row[5]
-                backup1 = row[6]
-                # backup2 = row[7]
                 #
                 try:
                     newH = int(self.__ui.getValue("window.editH"))
@@ -262,16 +450,16 @@ class App:
                     newS = int(self.__ui.getValue("window.editS"))
                 except Exception:
                     newS = 0
-                timeString = str(newH).zfill(2) + ":" + str(newM).zfill(2) + ":" + str(newS).zfill(2)
                 secToday = 3600 * newH + 60 * newM + newS
                 # ______________________________________________ gleiche Zeit?
-                if secToday == backup0:
+                # the fields only hold whole seconds, the stored time has milliseconds
+                if secToday == int(backup0):
                     print(str(self.__changeNr) + " nicht geändert ?!")
                 else:
                     #
-                    oldTime = row[1]
-                    self.__db.updateDataByNumber(self.__changeNr, timeString, newH, newM, newS, secToday,
-                                                 backup0, backup1, oldTime, "Change time of")
+                    changeNr = self.__changeNr
+                    self.__core.changeTime(changeNr, newH, newM, newS,
+                                           callback=lambda: self.__updateListEntry(changeNr))
                     print(str(self.__changeNr) + " wurde geändert")
             # ---
             myOLD = "nichts mehr gewählt, zuletzt: " + str(self.__changeNr)
@@ -284,8 +472,6 @@ class App:
             self.__ui.clear("window.editS")
             TRZtext = "Change with List"
             self.__ui.config("window.lblChangeText", text=TRZtext)
-            # Update, da sonst verunsichernd:
-            self.refeshList()
 
     # ========================================================================
     def deleteTime(self):
@@ -293,7 +479,8 @@ class App:
         Delete time entry in database
         """
         if self.__changeNr is not None:
-            self.__db.deleteDataByNumber(self.__changeNr)
+            changeNr = self.__changeNr
+            self.__core.deleteTime(changeNr, callback=lambda: self.__removeListEntry(changeNr))
             # ---
             myOLD = "nichts mehr gewählt, zuletzt: " + str(self.__changeNr)
             self.__ui.config("window.lblChangeStatus", text=myOLD)
@@ -305,12 +492,10 @@ class App:
             self.__ui.clear("window.editS")
             TRZtext = "Change with List"
             self.__ui.config("window.lblChangeText", text=TRZtext)
-            # Update, da sonst verunsichernd:
-            self.refeshList()
 
     # == FTP ======================================================================
     def writeLocalTrzFile(self):
-        fileName = self.__config.get("data.TRZFile")
+        fileName = self.__core.trzFileName()
         if self.__writeTrzFile(fileName):
             messagebox.showinfo(title="TRZ File", message=f"TRZ File '{fileName}' geschrieben.")
         else:
@@ -318,32 +503,73 @@ class App:
                                  message=f"TRZ File '{fileName}' konnte nicht lokal geschrieben werden.")
 
     def sendFile(self):
-        fileName = self.__config.get("data.TRZFile")
-        dbName = self.__config.get("data.SQLiteFile")
-        if self.__writeTrzFile(fileName):
-            if self.__transport and self.__transport.sendFile([fileName, dbName]):
-                messagebox.showinfo(title="TRZ File", message=f"TRZ File '{fileName}' erfolgreich übertragen.")
-            else:
-                messagebox.showerror(title="TRZ File", message=f"TRZ File '{fileName}' nicht übertragen.")
-        else:
+        """
+        Write the .trz file and start the transfer of .trz and database in the background.
+        Capturing continues during the transfer.
+        """
+        fileName = self.__core.trzFileName()
+        if self.__core.isTransferRunning():
+            messagebox.showinfo(title="TRZ File", message="Übertragung läuft bereits.")
+        elif not self.__startTransfer(manual=True):
             messagebox.showerror(title="TRZ File",
                                  message=f"TRZ File '{fileName}' konnte nicht lokal geschrieben werden.")
 
-    def __writeTrzFile(self, fileName: str) -> bool:
-        # print("would now write fo file")
-        try:
-            with open(fileName, "w") as file:
-                data = self.__db.getAllData()
-                for satz in data:
-                    file.write(f"{str(satz[0]).zfill(4)}\t{satz[1]}\n")
-                file.close()
-                return True
-        except Exception:
+    def __scheduleAutoSync(self):
+        """
+        (Re)start the auto sync timer with the current AutoSyncInterval, 0 stops it.
+        """
+        self.__ui.after_cancel("window", self.__autoSyncId)
+        self.__autoSyncId = None
+        interval = self.__config.get("ftp.AutoSyncInterval")
+        if interval and interval > 0:
+            self.__autoSyncId = self.__ui.after("window", interval * 1000, self.__autoSyncTimer)
+
+    def __autoSyncTimer(self):
+        self.__autoSyncId = None
+        self.__autoSync()
+        self.__scheduleAutoSync()
+
+    def __autoSync(self):
+        """
+        Transfer in the background without messages, if something changed since the last successful transfer.
+        """
+        if not self.__core.isTransferRunning():
+            self.__core.autoSync()
+            if self.__core.isTransferRunning():
+                self.__ui.config("window.lblTransfer", text="Übertragung gestartet")
+
+    def __startTransfer(self, manual: bool) -> bool:
+        """
+        Export and start the transfer, see RveZeitCore.startTransfer().
+        """
+        if not self.__core.startTransfer(manual):
             return False
+        if self.__core.isTransferRunning():
+            self.__ui.config("window.lblTransfer", text="Übertragung gestartet")
+        return True
+
+    def __transferProgress(self, file: str, sent: int, size: int):
+        percent = 100 if size == 0 else int(100 * sent / size)
+        self.__ui.config("window.lblTransfer", text=f"{file}: {percent}%")
+
+    def __transferDone(self, fileName: str, result: bool, manual: bool):
+        if result:
+            self.__ui.config("window.lblTransfer", text=f"Übertragen {time.strftime('%H:%M:%S')}")
+            if manual:
+                messagebox.showinfo(title="TRZ File", message=f"TRZ File '{fileName}' erfolgreich übertragen.")
+        else:
+            self.__ui.config("window.lblTransfer", text="Übertragung fehlgeschlagen")
+            if manual:
+                messagebox.showerror(title="TRZ File", message=f"TRZ File '{fileName}' nicht übertragen.")
+
+    def __writeTrzFile(self, fileName: str) -> bool:
+        return self.__core.writeTrzFile(fileName)
 
     # -=== Menu Handler
     def exit(self):
         if messagebox.askyesno('Verify', 'Really quit?'):
+            self.__persistCaptures()
+            self.__db.flush()
             self.__ui.exit()
 
     def show_about(self):
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# capture clock, used by the user interface and by the headless mode
+import time
+
+
+class Clock:
+    """
+    High resolution monotonic counter anchored to the wall clock.
+    All captured times are derived from this anchor, so they are not limited
+    to the whole seconds of time.localtime() and can not jump backwards.
+    check() anchors again when the wall clock was stepped (e.g. NTP after the boot
+    of a station without RTC), so the captures follow the corrected time.
+    """
+
+    # seconds the wall clock may differ from the anchored counter before it is anchored again
+    maxDrift = 0.25
+
+    def __init__(self):
+        # (seconds of the day, epoch, perf_counter) taken together, replaced as a whole
+        self.__anchor = None
+        # offset between the event time of the window system (ms) and perf_counter
+        self.__eventOffset = None
+        self.__lastEventTime = 0
+        self.anchor()
+
+    def anchor(self):
+        counter = time.perf_counter()
+        wall = time.time()
+        jetzt = time.localtime(wall)
+        self.__anchor = (3600*jetzt.tm_hour + 60*jetzt.tm_min + jetzt.tm_sec + (wall % 1), wall, counter)
+
+    def check(self) -> bool:
+        """
+        Anchor again if the wall clock differs from the anchored counter by more than maxDrift.
+        Returns True if the clock was anchored again.
+        """
+        secToday, wall, counter = self.__anchor
+        drift = time.time() - (wall + time.perf_counter() - counter)
+        if abs(drift) <= self.maxDrift:
+            return False
+        print(f"Clock stepped by {drift:+.3f} s, anchored again.")
+        self.anchor()
+        return True
+
+    def secToday(self) -> float:
+        """
+        Current time as seconds of the day with millisecond resolution.
+        """
+        return self.__counterSecToday(time.perf_counter())
+
+    def eventSecToday(self, eventTime) -> float:
+        """
+        Time of an event of the window system as seconds of the day.
+        The event time is the ms clock of the window system. It is mapped to perf_counter
+        with the smallest offset seen so far, which is the one with the least handler delay.
+        Without a usable event time (button command) the current time is used.
+        """
+        if not isinstance(eventTime, int) or eventTime <= 0:
+            return self.secToday()
+        offset = time.perf_counter() - eventTime / 1000
+        # the window system clock wrapped or was restarted: start over
+        if self.__eventOffset is None or eventTime < self.__lastEventTime or offset < self.__eventOffset - 1:
+            self.__eventOffset = offset
+        else:
+            self.__eventOffset = min(self.__eventOffset, offset)
+        self.__lastEventTime = eventTime
+        return self.__counterSecToday(eventTime / 1000 + self.__eventOffset)
+
+    def __counterSecToday(self, counter: float) -> float:
+        secToday, wall, anchorCounter = self.__anchor
+        return round((secToday + counter - anchorCounter) % 86400, 3)
+
+
+def epochSecToday(epoch: float) -> float:
+    """
+    Seconds of the day of a time.time() value, e.g. given by the writer of an event.
+    """
+    jetzt = time.localtime(epoch)
+    return round(3600*jetzt.tm_hour + 60*jetzt.tm_min + jetzt.tm_sec + (epoch % 1), 3)
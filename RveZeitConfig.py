@@ -5,23 +5,70 @@ Created on 18.3.2023
 @author: Dr. Ulf Meerwald, Martin Schmidt
 """
 
+import copy
 import json
 import configparser
-import tkinter as tk
+import os
+import threading
+
+import RveZeitLayout
 
 AppVersion = "20231929-0931"
 
+# marks a missing value in Config.get
+_missing = object()
+
+
+class Section:
+    """
+    Values of one configuration section as attributes, e.g. `config.data.AutoIncrement`.
+    A subclass with __slots__ for the parameters of the section is created by
+    sectionClass(), so reading a value is a plain attribute access.
+    """
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{name}={getattr(self, name, None)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+
+_sectionClasses = {}
+
+
+def sectionClass(section: str, parameters: tuple) -> type:
+    """
+    Slotted Section class for the parameters of a section, created once per set of parameters.
+    """
+    key = (section, parameters)
+    if key not in _sectionClasses:
+        _sectionClasses[key] = type(f"{section.capitalize()}Section", (Section,), {"__slots__": parameters})
+    return _sectionClasses[key]
+
 
 class Config:
     """
     Configuration for RVE Zeit
     The program options can be retieved by the function `get(property: str)`
-    The GUI layout can be retrieved by `getUI()`
+    The values are also attributes of the sections, e.g. `config.data.AutoIncrement`,
+    which is faster than `get()` and used in the handlers.
+    `reload()` reads the .ini file again and calls the hooks registered with `onReload()`.
+    The GUI layout can be retrieved by `getUI()`, it is loaded from the layout file
+    (layout.json) on the first call.
     """
 
+    app: Section
+    data: Section
+    db: Section
+    ui: Section
+    ftp: Section
+    transport: Section
+    replication: Section
+
     __configData = {}
     __uiDesign = {}
     __configFileName = "RVEZeit.ini"
+    # seconds between the first change by updateConfig() and writing the .ini file
+    __persistDelay = 1.0
     __defaultPosition = "Test"
 
     # configVariables defines the availabel configuraion variables
@@ -54,6 +101,45 @@ class Config:
                 "type": "int",
                 "min": 1,
                 "max": 3
+            },
+            "TimeDecimals": {
+                "ini": "DEFAULT.TimeDecimals",
+                "default": 0,
+                "type": "int",
+                "min": 0,
+                "max": 3
+            },
+            "Race": {
+                "ini": "DEFAULT.Race",
+                "default": 1,
+                "type": "int",
+                "min": 1
+            }
+        },
+        "db": {
+            "WriteBehind": {
+                "ini": "DB.WriteBehind",
+                "default": False,
+                "type": "boolean"
+            },
+            "JournalMode": {
+                "ini": "DB.JournalMode",
+                "default": "WAL"
+            },
+            "Synchronous": {
+                "ini": "DB.Synchronous",
+                "default": "FULL"
+            },
+            "MmapSize": {
+                "ini": "DB.MmapSize",
+                "default": 0,
+                "type": "int",
+                "min": 0
+            },
+            "CacheSize": {
+                "ini": "DB.CacheSize",
+                "default": -2000,
+                "type": "int"
             }
         },
         "ftp": {
@@ -68,6 +154,98 @@ class Config:
             },
             "FTPdir": {
                 "ini": "FTP.Directory"
+            },
+            "Workers": {
+                "ini": "FTP.Workers",
+                "default": 2,
+                "type": "int",
+                "min": 1,
+                "max": 8
+            },
+            "KeepAlive": {
+                "ini": "FTP.KeepAlive",
+                "default": 60,
+                "type": "int",
+                "min": 0
+            },
+            "Timeout": {
+                "ini": "FTP.Timeout",
+                "default": 30,
+                "type": "int",
+                "min": 1
+            },
+            "Retries": {
+                "ini": "FTP.Retries",
+                "default": 3,
+                "type": "int",
+                "min": 0
+            },
+            "AutoSyncInterval": {
+                "ini": "FTP.AutoSyncInterval",
+                "default": 0,
+                "type": "int",
+                "min": 0
+            },
+            "AutoSyncCaptures": {
+                "ini": "FTP.AutoSyncCaptures",
+                "default": 0,
+                "type": "int",
+                "min": 0
+            },
+            "ExportMode": {
+                "ini": "FTP.ExportMode",
+                "default": "full"
+            },
+            "Compression": {
+                "ini": "FTP.Compression",
+                "default": "none"
+            },
+            "SnapshotEvery": {
+                "ini": "FTP.SnapshotEvery",
+                "default": 20,
+                "type": "int",
+                "min": 1
+            }
+        },
+        "ui": {
+            "Layout": {
+                "ini": "UI.Layout",
+                "default": ""
+            }
+        },
+        "transport": {
+            "Type": {
+                "ini": "TRANSPORT.Type",
+                "default": "ftp"
+            },
+            "Directory": {
+                "ini": "TRANSPORT.Directory"
+            },
+            "Url": {
+                "ini": "TRANSPORT.Url"
+            }
+        },
+        "replication": {
+            "Port": {
+                "ini": "REPLICATION.Port",
+                "default": 0,
+                "type": "int",
+                "min": 0,
+                "max": 65535
+            },
+            "Peers": {
+                "ini": "REPLICATION.Peers",
+                "default": ""
+            },
+            "Interval": {
+                "ini": "REPLICATION.Interval",
+                "default": 200,
+                "type": "int",
+                "min": 20
+            },
+            "ElapsedFrom": {
+                "ini": "REPLICATION.ElapsedFrom",
+                "default": "Start"
             }
         }
     }
@@ -84,9 +262,24 @@ class Config:
         self.__configData["app"]["logo"] = "RVE-Logo.gif"
         self.__configData["data"] = {}
         self.__configData["data"]["Position"] = self.__defaultPosition
+        self.__reloadHooks = []
+        # values changed by updateConfig() and not yet written: (section, option) of the .ini -> value
+        self.__dirty = {}
+        self.__persistLock = threading.Lock()
+        # held while the file is written, the Tk thread only waits for __persistLock
+        self.__writeLock = threading.Lock()
+        self.__persistTimer = None
         # Load configuration from .ini file
         self.__loadConfigFromINI()
+        self.__deriveValues()
+        self.__precompute()
+
+        # print(json.dumps(self.__configData, indent=2))
+        # print()
+        # print(f"Input elements: {self.get('data.InputGroups')}")
+        # exit(0)
 
+    def __deriveValues(self):
         # set parameter which are only nown after loading from .ini file
         self.__configData["data"]["TRZFile"] = f'{self.__configData["data"]["Position"]}.trz'
         self.__configData["data"]["SQLiteFile"] = f'{self.__configData["data"]["Position"]}.db'
@@ -95,458 +288,47 @@ class Config:
         self.__configData["app"]["title"] = f"python TriaZeit mit Datenbank - {AppVersion} - " \
             + f"{self.__configData['data']['Position']}"
 
-        # print(json.dumps(self.__configData, indent=2))
-        # print()
-        # print(f"Input elements: {self.get('data.InputGroups')}")
-        # exit(0)
+    def __precompute(self):
+        """
+        Create the section attributes and the flat lookup table of get() from the loaded values.
+        """
+        self.__values = {}
+        for section, parameters in self.__configData.items():
+            values = sectionClass(section, tuple(parameters))()
+            for parameter, value in parameters.items():
+                setattr(values, parameter, value)
+                self.__values[f"{section}.{parameter}"] = value
+            setattr(self, section, values)
 
-        # -- GUI Elemente
-        self.__uiDesign["title"] = self.get("app.title")
-        self.__uiDesign["geometry"] = "800x600"
-        self.__uiDesign["resizable"] = {
-            "width": False,
-            "height":  False
-        }
-        self.__uiDesign["menu"] = {
-            "name": "rootMenu",
-            "description": "Root Menu",
-            "properties": {},
-            "elements": [
-                {
-                    "name": "fileMenu",
-                    "type": "cascade",
-                    "description": "File Menu",
-                    "menuProperties": {
-                        "tearoff": 0
-                    },
-                    "properties": {
-                        "label": "File"
-                    },
-                    "elements": [
-                        {
-                            "name": "transfere",
-                            "type": "command",
-                            "description": "Transfere Command in File Menu",
-                            "properties": {
-                                "label": "FTP Transfere",
-                                "accelerator": "Ctrl+T"
-                            }
-                        },
-                        {
-                            "name": "sep1",
-                            "type": "separator",
-                            "description": "Separator before Exit"
-                        },
-                        {
-                            "name": "exit",
-                            "type": "command",
-                            "description": "Exit Command in File Menu",
-                            "properties": {
-                                "label": "Exit",
-                                "accelerator": "Ctrl+Q"
-                            }
-                        }
-                    ]
-                },
-                {
-                    "name": "helpMenu",
-                    "type": "cascade",
-                    "description": "Help Menu",
-                    "menuProperties": {
-                        "tearoff": 0
-                    },
-                    "properties": {
-                        "label": "Help"
-                    },
-                    "elements": [
-                        {
-                            "name": "about",
-                            "type": "command",
-                            "description": "About Command in Help Menu",
-                            "properties": {
-                                "label": "About...",
-                                "accelerator": "Ctrl+A"
-                            }
-                        }
-                    ]
-                }
-            ]
-        }
+    def reload(self) -> set:
+        """
+        Read the .ini file again. The hooks registered with onReload() are called
+        with the set of the changed properties, e.g. {"data.TimeDecimals"}.
+        If the file can not be read, the current values are kept.
+        Values of updateConfig() which are not written yet are written first, so they are not lost.
+        """
+        self.flush()
+        oldData = copy.deepcopy(self.__configData)
+        oldValues = self.__values
+        try:
+            self.__loadConfigFromINI()
+        except SystemExit:
+            print("ERROR: Konfiguration nicht neu geladen.")
+            self.__configData = oldData
+            return set()
+        self.__deriveValues()
+        self.__precompute()
+        changed = {key for key, value in self.__values.items() if oldValues.get(key, _missing) != value}
+        if changed:
+            for hook in self.__reloadHooks:
+                hook(changed)
+        return changed
 
-        # Add UI elements like labels, buttons, entries, and ...
-        self.__uiDesign["uiElements"] = []
-        self.__uiDesign["uiElements"].append({
-            "name": "lblTitle",
-            "type": "label",
-            "description": "Main Title inside the application window",
-            "properties": {
-                "text": "ZEITNAHME Langstrecke ",
-                "font": ("Hack", 16),
-                "foreground": "blue",
-                "justify": "left",
-                "anchor": "w"
-            },
-            "placement": {
-                "x": 10,
-                "y": 5,
-                "width": 390,
-                "height": 30
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "lblChangeText",
-            "type": "label",
-            "description": "Label above time change",
-            "properties": {
-                "text": "Change: -",
-                "font": ("Hack", 18),
-                "foreground": "blue",
-                "justify": "left",
-                "anchor": "w"
-            },
-            "placement": {
-                "x": 10,
-                "y": 110,
-                "width": 205,
-                "height": 30
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "lblChangeStatus",
-            "type": "label",
-            "description": "Label below time change",
-            "properties": {
-                "text": "Noch keine Angaben",
-                "font": ("Hack", 14),
-                "foreground": "blue",
-                "justify": "left",
-                "anchor": "w"
-            },
-            "placement": {
-                "x": 10,
-                "y": 210,
-                "width": 400,
-                "height": 30
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "lblClock",
-            "type": "label",
-            "description": "Clock",
-            "properties": {
-                "text": "00:00:00",
-                "font": ('calibri', 40, 'bold'),
-                "foreground": "white",
-                "background": "#606060",
-                "justify": tk.CENTER,
-                "anchor": tk.CENTER
-            },
-            "placement": {
-                "x": 200,
-                "y": 500,
-                "width": 400,
-                "height": 80
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "frmEntryList",
-            "type": "frame",
-            "description": "Show list of already recorded number - time entries.",
-            "placement": {
-                "x": 420,
-                "y": 125,
-                "width": 350,
-                "height": 300
-            },
-            "uiElements": [{
-                    "name": "frmEntryListScrollbar",
-                    "type": "scrollbar",
-                    "description": "Add scrollbar to time entries frame.",
-                    "pack": {
-                        "side": tk.RIGHT,
-                        "fill": tk.Y
-                    }
-                },
-                {
-                    "name": "frmEntryListBox",
-                    "type": "listbox",
-                    "description": "Add listbox to time entries frame.",
-                    "properties": {
-                        "width": 300,
-                        "font": ("Hack", 14)
-                    },
-                    "pack": {
-                        "side": tk.LEFT,
-                        "fill": tk.BOTH
-                    }
-                }]
-        })
-        keys = ["s", "d", "f"]
-        for number in range(0, self.get('data.InputGroups')):
-            self.__uiDesign["uiElements"].append({
-                "name": f"text{number+1}",
-                "type": "entry",
-                "description": f"text entry {number+1}",
-                "validation": {
-                    "type": "integer",
-                    "length": 4
-                },
-                "properties": {
-                    "font": ("Hack", 26)
-                },
-                "placement": {
-                    "x": 10 + 210*number,
-                    "y": 35,
-                    "width": 85,
-                    "height": 60
-                }
-            })
-            self.__uiDesign["uiElements"].append({
-                "name": f"btnCheck{number+1}",
-                "type": "button",
-                "description": f"button check for text entry {number+1}",
-                "properties": {
-                    "text": "Check"
-                },
-                "placement": {
-                    "x": 100 + 210*number,
-                    "y": 35,
-                    "width": 90,
-                    "height": 30
-                }
-            })
-            self.__uiDesign["uiElements"].append({
-                "name": f"btnCommit{number+1}",
-                "type": "button",
-                "description": f"button commit for text entry {number+1}",
-                "properties": {
-                    "text": f"Zeitnahme ({keys[number]})"
-                },
-                "placement": {
-                    "x": 100 + 210*number,
-                    "y": 65,
-                    "width": 90,
-                    "height": 30
-                }
-            })
-        self.__uiDesign["uiElements"].append({
-            "name": "editH",
-            "type": "entry",
-            "description": "text edit hour",
-            "validation": {
-                "type": "hour"
-            },
-            "properties": {
-                "font": ("Hack", 26)
-            },
-            "placement": {
-                "x": 10,
-                "y": 145,
-                "width": 55,
-                "height": 60
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "editM",
-            "type": "entry",
-            "description": "text edit minutes",
-            "validation": {
-                "type": "minute"
-            },
-            "properties": {
-                "font": ("Hack", 26)
-            },
-            "placement": {
-                "x": 110,
-                "y": 145,
-                "width": 55,
-                "height": 60
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "editS",
-            "type": "entry",
-            "description": "text edit seconds",
-            "validation": {
-                "type": "minute"
-            },
-            "properties": {
-                "font": ("Hack", 26)
-            },
-            "placement": {
-                "x": 210,
-                "y": 145,
-                "width": 55,
-                "height": 60
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "lblDoppelpunkt1",
-            "type": "label",
-            "description": "Doppelpunkt zwischen editH und editM",
-            "properties": {
-                "text": ":",
-                "font": ("Hack", 16),
-                "foreground": "black"
-            },
-            "placement": {
-                "x": 80,
-                "y": 160
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "lblDoppelpunkt2",
-            "type": "label",
-            "description": "Doppelpunkt zwischen editM und editS",
-            "properties": {
-                "text": ":",
-                "font": ("Hack", 16),
-                "foreground": "black"
-            },
-            "placement": {
-                "x": 180,
-                "y": 160
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "btnChangeGet",
-            "type": "button",
-            "description": "button get data entry from list",
-            "properties": {
-                "text": "Get from List"
-            },
-            "placement": {
-                "x": 300,
-                "y": 125,
-                "width": 100,
-                "height": 30
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "btnChangeSave",
-            "type": "button",
-            "description": "button save changed data entry",
-            "properties": {
-                "text": "Change"
-            },
-            "placement": {
-                "x": 300,
-                "y": 165,
-                "width": 100,
-                "height": 30
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "btnChangeDelete",
-            "type": "button",
-            "description": "button delete data entry",
-            "properties": {
-                "text": "Delete"
-            },
-            "placement": {
-                "x": 300,
-                "y": 205,
-                "width": 100,
-                "height": 30
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "btnUpdateList",
-            "type": "button",
-            "description": "button update data in list",
-            "properties": {
-                "text": "Update"
-            },
-            "placement": {
-                "x": 300,
-                "y": 395,
-                "width": 100,
-                "height": 30
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "btnSaveLocal",
-            "type": "button",
-            "description": "button write local trz file",
-            "properties": {
-                "text": "Save as TRZ"
-            },
-            "placement": {
-                "x": 10,
-                "y": 275,
-                "width": 100,
-                "height": 30
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "btnTransfere",
-            "type": "button",
-            "description": "button start ftp transfer",
-            "properties": {
-                "text": "FTP Transfer"
-            },
-            "placement": {
-                "x": 10,
-                "y": 315,
-                "width": 100,
-                "height": 30
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "radioAutoincrement",
-            "type": "radiobutton",
-            "description": "radio button Autoincrement",
-            "properties": {
-                "text": "Automatic Increment",
-                "value": 1
-            },
-            "placement": {
-                "x": 10,
-                "y": 355,
-                "width": 150
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "radioAutoclear",
-            "type": "radiobutton",
-            "description": "radio button Autoclear",
-            "properties": {
-                "text": "Automatic Clear",
-                "value": 0
-            },
-            "placement": {
-                "x": 10,
-                "y": 375,
-                "width": 150
-            }
-        })
-        self.__uiDesign["uiElements"].append({
-            "name": "frmLogo",
-            "type": "frame",
-            "description": "Frame for logo",
-            "properties": {},
-            "placement": {
-                "x": 670,
-                "y": 10,
-                "width": 100,
-                "height": 100
-            },
-            "uiElements": [
-                {
-                    "name": "frmLogoImage",
-                    "type": "label",
-                    "description": "Label to hold the image",
-                    "properties": {
-                        "font": ("Hack", 16),
-                        "foreground": "black"
-                    },
-                    "pack": {
-                        "expand": True,
-                        "fill": tk.BOTH
-                    }
-                }
-            ]
-        })
+    def onReload(self, hook):
+        """
+        Register hook(changed: set), called by reload() if values changed.
+        """
+        self.__reloadHooks.append(hook)
 
     def __str__(self) -> str:
         """
@@ -558,7 +340,11 @@ class Config:
         """
         Get the property value.
         Separate level with `.`. e.g. Application Version: app.version
+        Values are looked up in the precomputed table, only other paths walk the configuration.
         """
+        configData = self.__values.get(property, _missing)
+        if configData is not _missing:
+            return configData
         configData = None
         if property is not None:
             keyList = property.split(".")
@@ -576,6 +362,10 @@ class Config:
         Get the property value from the UI Design
         Separate level with `.`.
         """
+        if not self.__uiDesign:
+            self.__loadUIDesign()
+        if property is not None and "." not in property:
+            return self.__uiDesign.get(property)
         uiData = None
         if property is not None:
             keyList = property.split(".")
@@ -587,6 +377,18 @@ class Config:
                     uiData = None
         return uiData
 
+    def __loadUIDesign(self):
+        """
+        Load the compiled build plan of the layout file, see RveZeitLayout.
+        """
+        layoutFile = self.get("ui.Layout") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "layout.json")
+        try:
+            self.__uiDesign = dict(RveZeitLayout.load(layoutFile, self.get("data.InputGroups")))
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Laden des Layouts '{layoutFile}' fehlgeschlagen: {e}")
+            exit(1)
+        self.__uiDesign["title"] = self.get("app.title")
+
     def __loadConfigFromINI(self):
         """
         Load configigruation from .ini file into runtime configuration.
@@ -687,13 +489,11 @@ class Config:
                                     except Exception:
                                         pass
                                     self.__configData[section][parameter] = value
-                                # Update .ini file
-                                config = configparser.ConfigParser()
-                                config.read(self.__configFileName)
-                                config.set(iniArray[0], iniArray[1], str(value))
-                                with open(self.__configFileName, "w") as fp:
-                                    config.write(fp, self.__configFileName)
-                                    fp.close()
+                                    setattr(getattr(self, section), parameter, value)
+                                    self.__values[f"{section}.{parameter}"] = value
+                                # Update .ini file in the background
+                                self.__persist(iniArray[0], iniArray[1], str(value))
+                                result = True
                             else:
                                 print("ERROR: configVariables definition error. "
                                       + f"ini path for {section}.{parameter} is invalid.")
@@ -710,3 +510,51 @@ class Config:
         else:
             print("ERROR: updateConfig given section or parameter is empty.")
         return result
+
+    def __persist(self, iniSection: str, iniOption: str, value: str):
+        """
+        Mark the value for writing. The .ini file is written by a timer thread
+        __persistDelay seconds after the first unwritten change, so a series of
+        changes is written once.
+        """
+        with self.__persistLock:
+            self.__dirty[(iniSection, iniOption)] = value
+            if self.__persistTimer is None:
+                self.__persistTimer = threading.Timer(self.__persistDelay, self.flush)
+                self.__persistTimer.daemon = True
+                self.__persistTimer.start()
+
+    def flush(self):
+        """
+        Write the values changed by updateConfig() into the .ini file now.
+        Has to be called before the program ends.
+        The file is written to a temporary file and renamed, so it is never truncated.
+        """
+        with self.__writeLock:
+            with self.__persistLock:
+                if self.__persistTimer is not None:
+                    self.__persistTimer.cancel()
+                    self.__persistTimer = None
+                dirty = self.__dirty
+                self.__dirty = {}
+            if not dirty:
+                return
+            tempName = f"{self.__configFileName}.tmp"
+            try:
+                config = configparser.ConfigParser()
+                config.read(self.__configFileName)
+                for (iniSection, iniOption), value in dirty.items():
+                    if iniSection != configparser.DEFAULTSECT and not config.has_section(iniSection):
+                        config.add_section(iniSection)
+                    config.set(iniSection, iniOption, value)
+                with open(tempName, "w") as fp:
+                    config.write(fp)
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                os.replace(tempName, self.__configFileName)
+            except Exception as e:
+                print(f"ERROR: Speichern der Konfiguration '{self.__configFileName}' fehlgeschlagen: {e}")
+                # written with the next change or flush, newer values win
+                with self.__persistLock:
+                    for key, value in dirty.items():
+                        self.__dirty.setdefault(key, value)
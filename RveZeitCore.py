@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# capture, export and transfer without user interface, used by RveZeitApp and RveZeitHeadless
+import os
+import time
+
+import RveZeitConfig
+import RveZeitDB
+import RveZeitExport
+
+
+class Core:
+    """
+    Stores the captures and changes, exports and transfers them.
+    Keeps the state of the automatic and the delta transfer, so the user interface
+    and the headless mode behave the same way.
+    """
+
+    def __init__(self, config: RveZeitConfig, db: RveZeitDB, transport=None, replication=None):
+        self.__config = config
+        self.__db = db
+        self.__transport = transport
+        self.__replication = replication
+        self.__transferRunning = False
+        # auto sync: number of changes, number of changes already uploaded, last successful upload
+        self.__changeCount = 0
+        self.__syncedChangeCount = 0
+        self.__capturesSinceSync = 0
+        self.__lastSync = None
+        # delta export: changelog sequence number of the last uploaded export (None: no snapshot yet)
+        self.__exportedSeq = None
+        self.__deltasSinceSnapshot = 0
+        # done(fileName, result, manual) and progress(file, sent, size) of the front end
+        self.__done = None
+        self.__progress = None
+
+    def setTransferHandlers(self, done=None, progress=None):
+        """
+        done(fileName: str, result: bool, manual: bool) is called when a transfer finished,
+        progress(file: str, sent: int, size: int) while it is running.
+        """
+        self.__done = done
+        self.__progress = progress
+
+    def processEvents(self) -> dict:
+        """
+        Handle the acknowledgements of the database writes, the events of the background
+        transfers and of the replication. Has to be called regularly from the thread which
+        owns the database connection. Returns the changes of the replication, see
+        RveZeitReplication.processEvents().
+        """
+        self.__db.processAcknowledgements()
+        if self.__transport:
+            self.__transport.processEvents()
+        if self.__replication:
+            return self.__replication.processEvents()
+        return {}
+
+    # == captures ============================================================
+    def capture(self, nummer: str, secToday: float, callback=None):
+        """
+        Store the time of the number, a transfer is started after AutoSyncCaptures captures.
+        """
+        whole = int(secToday)
+        timeString = RveZeitExport.formatTime(secToday)
+        self.__db.upsertDataByNumber(nummer, timeString, whole // 3600, whole // 60 % 60, whole % 60, secToday,
+                                     callback=callback)
+        self.__changeCount += 1
+        self.__capturesSinceSync += 1
+        autoSyncCaptures = self.__config.ftp.AutoSyncCaptures
+        if autoSyncCaptures and self.__capturesSinceSync >= autoSyncCaptures:
+            self.autoSync()
+
+    def changeTime(self, nummer: int, hour: int, minuten: int, sekunden: int, callback=None):
+        timeString = str(hour).zfill(2) + ":" + str(minuten).zfill(2) + ":" + str(sekunden).zfill(2)
+        secToday = 3600 * hour + 60 * minuten + sekunden
+        self.__db.updateDataByNumber(nummer, timeString, hour, minuten, sekunden, secToday, "Change time of",
+                                     callback=callback)
+        self.__changeCount += 1
+
+    def deleteTime(self, nummer: int, callback=None):
+        self.__db.deleteDataByNumber(nummer, callback=callback)
+        self.__changeCount += 1
+
+    def selectRace(self, race: int):
+        """
+        Switch captures and exports to the race. The next transfer is a complete snapshot.
+        """
+        self.__db.setRace(race)
+        self.__config.updateConfig("data", "Race", race)
+        self.__exportedSeq = None
+        self.__deltasSinceSnapshot = 0
+
+    # == transfer ============================================================
+    def isTransferRunning(self) -> bool:
+        return self.__transferRunning
+
+    def getLastSync(self) -> float:
+        """
+        time.monotonic() of the last successful transfer, None if there was none.
+        """
+        return self.__lastSync
+
+    def trzFileName(self) -> str:
+        return RveZeitExport.raceFileName(self.__config.get("data.TRZFile"), self.__db.getRace())
+
+    def writeTrzFile(self, fileName: str) -> bool:
+        return RveZeitExport.writeTrzFile(self.__db, fileName, self.__config.get("data.TimeDecimals") or 0)
+
+    def autoSync(self):
+        """
+        Transfer in the background, if something changed since the last successful transfer.
+        """
+        if not self.__transferRunning and self.__changeCount != self.__syncedChangeCount:
+            self.startTransfer(manual=False)
+
+    def startTransfer(self, manual: bool) -> bool:
+        """
+        Export and start the transfer.
+        In delta mode only the changes since the last upload are exported,
+        every SnapshotEvery transfers (and on the first one) the complete .trz and database.
+        Returns False if the export failed.
+        """
+        fileName = self.trzFileName()
+        # the transfer contains all changes up to now
+        changeCount = self.__changeCount
+        self.__capturesSinceSync = 0
+        lastChange = self.__db.getLastChange()
+        snapshot = str(self.__config.get("ftp.ExportMode")).lower() != "delta" or self.__exportedSeq is None \
+            or self.__deltasSinceSnapshot + 1 >= self.__config.get("ftp.SnapshotEvery")
+        if snapshot:
+            if not self.writeTrzFile(fileName):
+                return False
+            # consistent (and compressed) copy of the database
+            dbName = self.__db.exportSnapshot(self.__config.get("ftp.Compression"))
+            if not dbName:
+                return False
+            files = [fileName, dbName]
+        else:
+            fileName = RveZeitExport.writeDeltaFile(self.__db, self.__config.get("data.Position"),
+                                                    self.__exportedSeq, lastChange)
+            if not fileName:
+                return False
+            files = [fileName]
+        if self.__transport:
+            self.__transferRunning = True
+            self.__transport.sendFile(files,
+                                      done=lambda result: self.__transferDone(fileName, result, changeCount, manual,
+                                                                              lastChange, snapshot),
+                                      progress=self.__progress)
+        elif self.__done:
+            self.__done(fileName, False, manual)
+        return True
+
+    def __transferDone(self, fileName: str, result: bool, changeCount: int, manual: bool,
+                       lastChange: int, snapshot: bool):
+        self.__transferRunning = False
+        if not snapshot:
+            # the delta file is written again from the last exported change if the transfer failed
+            try:
+                os.remove(fileName)
+            except OSError:
+                pass
+        if result:
+            self.__exportedSeq = lastChange
+            self.__deltasSinceSnapshot = 0 if snapshot else self.__deltasSinceSnapshot + 1
+            self.__syncedChangeCount = changeCount
+            self.__lastSync = time.monotonic()
+        if self.__done:
+            self.__done(fileName, result, manual)
@@ -6,8 +6,13 @@ Created on 18.3.2023
 """
 
 import RveZeitConfig
+import gzip
+import lzma
 import os
+import queue
+import shutil
 import sqlite3
+import threading
 
 
 class DB:
@@ -17,35 +22,63 @@ class DB:
 
     __dbConnection = None
     __dbCursor = None
+    __sqliteFile = None
+    __pragmas = []
+    # allowed values of the pragmas which can not be passed as parameter
+    __journalModes = ["DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"]
+    __synchronousModes = ["OFF", "NORMAL", "FULL", "EXTRA"]
+    # write-behind mode: operations for the writer thread and callbacks of committed operations
+    __writeQueue = None
+    __writer = None
+    __acknowledged = None
+    # hooks called with the error message of a failed write, see onWriteError()
+    __writeErrorHooks = []
+    # version of the schema in PRAGMA user_version, 1: several races per database
+    __schemaVersion = 1
+    # columns of zeiten, race_id is the last column so the rows keep their indexes
+    __zeitenColumns = "nummer INTEGER, " \
+        "timeString TEXT, " \
+        "h INTEGER, " \
+        "min INTEGER, " \
+        "sec INTEGER, " \
+        "secToday INTEGER, " \
+        "backup1 INTEGER, " \
+        "backup2 INTEGER, " \
+        "race_id INTEGER NOT NULL DEFAULT 1, " \
+        "PRIMARY KEY (race_id, nummer)"
+    # race of all reads and writes, see setRace()
+    __race = 1
+    # nummer -> row of zeiten of the current race, the same tuple as SELECT * returns
+    __index = {}
+    # PRAGMA data_version when the index was in sync with the database file
+    __indexVersion = None
+    # replicated times of other stations: station -> {(race, nummer): secToday}, station -> last seq
+    __mirror = {}
+    __mirrorSeq = {}
 
     def __init__(self, config: RveZeitConfig):
+        self.__writeErrorHooks = []
         # Existenz feststellen
         sqliteFile = config.get("data.SQLiteFile")
         print(f"Initialize Database {sqliteFile}")
         if sqliteFile:
+            self.__sqliteFile = sqliteFile
+            self.__pragmas = self.__storageProfile(config)
             if os.path.exists(sqliteFile):
                 # Verbindung zur Datenbank erzeugen
-                self.__dbConnection = sqlite3.connect(sqliteFile)
+                self.__dbConnection = self.__connect(sqliteFile)
                 # Datensatzcursor erzeugen
                 self.__dbCursor = self.__dbConnection.cursor()
 
                 print("Datenbank war bereits vorhanden.")
             else:
                 # Verbindung zur Datenbank erzeugen
-                self.__dbConnection = sqlite3.connect(sqliteFile)
+                self.__dbConnection = self.__connect(sqliteFile)
                 # Datensatzcursor erzeugen
                 self.__dbCursor = self.__dbConnection.cursor()
 
                 # Tabellen erzeugen
-                sql = "CREATE TABLE zeiten(" \
-                    "nummer INTEGER PRIMARY KEY, " \
-                    "timeString TEXT, " \
-                    "h INTEGER, " \
-                    "min INTEGER, " \
-                    "sec INTEGER, " \
-                    "secToday INTEGER, " \
-                    "backup1 INTEGER, " \
-                    "backup2 INTEGER)"
+                sql = f"CREATE TABLE zeiten({self.__zeitenColumns})"
                 self.__dbCursor.execute(sql)
                 # ------------------------------------------
                 sql = "CREATE TABLE meta(" \
@@ -56,19 +89,531 @@ class DB:
                       "sec INTEGER, " \
                       "name TEXT, " \
                       "int INTEGER, " \
-                      "data TEXT)"
+                      "data TEXT, " \
+                      "race_id INTEGER NOT NULL DEFAULT 1)"
                 self.__dbCursor.execute(sql)
+                self.__dbCursor.execute(f"PRAGMA user_version = {self.__schemaVersion}")
                 self.__dbConnection.commit()
                 # ------------------------------------------
                 print("Datenbank wurde neu erstellt.")
+
+            # also added to databases of older versions
+            self.__migrate()
+            self.__createRaces(config.get("data.Race") or 1)
+            self.__createCaptureView()
+            self.__createChangelog()
+            self.__createMirror()
+            self.__loadIndex()
+            self.__loadMirror()
+
+            if config.get("db.WriteBehind"):
+                self.__startWriter(sqliteFile)
         else:
             print("ERROR: No SQLiteFile specified in configuration.")
 
     def __del__(self):
-        print("Close Database")
-        # Verbindung beend
+        self.close()
+
+    def close(self):
+        """
+        Write all pending operations and close the database.
+        The callbacks of the operations are not called anymore, the user interface may be
+        destroyed already. Failed operations were printed by the writer thread.
+        """
+        if self.__writer:
+            self.__writeQueue.put(None)
+            self.__writer.join()
+            self.__writer = None
+            self.__writeQueue = None
+            self.__acknowledged = None
         if self.__dbConnection:
+            print("Close Database")
+            # Verbindung beend
             self.__dbConnection.close()
+            self.__dbConnection = None
+            self.__dbCursor = None
+
+    def __migrate(self):
+        """
+        Convert a database of an older version to the current schema in one transaction:
+        zeiten gets the column race_id and the key (race_id, nummer), meta and changelog
+        get race_id, existing times belong to race 1. View and triggers are dropped and
+        created again with the new definitions, the mirror is replicated again.
+        """
+        self.__dbCursor.execute("PRAGMA user_version")
+        if self.__dbCursor.fetchone()[0] >= self.__schemaVersion:
+            return
+        print("Datenbank wird für mehrere Rennen umgestellt.")
+        script = [
+            "BEGIN",
+            "DROP VIEW IF EXISTS erfassung",
+            "DROP TRIGGER IF EXISTS zeiten_changelog_insert",
+            "DROP TRIGGER IF EXISTS zeiten_changelog_update",
+            "DROP TRIGGER IF EXISTS zeiten_changelog_delete",
+            "DROP TABLE IF EXISTS mirror"
+        ]
+        if "race_id" not in self.__columns("zeiten"):
+            script += [
+                f"CREATE TABLE zeiten_races({self.__zeitenColumns})",
+                "INSERT INTO zeiten_races (nummer, timeString, h, min, sec, secToday, backup1, backup2) "
+                "SELECT nummer, timeString, h, min, sec, secToday, backup1, backup2 FROM zeiten",
+                "DROP TABLE zeiten",
+                "ALTER TABLE zeiten_races RENAME TO zeiten"
+            ]
+        for table in ["meta", "changelog"]:
+            columns = self.__columns(table)
+            if columns and "race_id" not in columns:
+                script.append(f"ALTER TABLE {table} ADD COLUMN race_id INTEGER NOT NULL DEFAULT 1")
+        script += [f"PRAGMA user_version = {self.__schemaVersion}", "COMMIT"]
+        self.__dbCursor.executescript(";\n".join(script) + ";")
+
+    def __columns(self, table: str) -> list:
+        self.__dbCursor.execute(f"PRAGMA table_info({table})")
+        return [column[1] for column in self.__dbCursor.fetchall()]
+
+    def __createRaces(self, race: int):
+        """
+        Create the table races and the index for the time ordered list of a race.
+        The index (race_id, nummer) is the primary key of zeiten.
+        """
+        sql = "CREATE TABLE IF NOT EXISTS races(" \
+            "race_id INTEGER PRIMARY KEY, " \
+            "name TEXT)"
+        self.__dbCursor.execute(sql)
+        sql = "CREATE INDEX IF NOT EXISTS zeiten_race_time ON zeiten(race_id, secToday DESC, nummer)"
+        self.__dbCursor.execute(sql)
+        self.__dbCursor.execute("INSERT OR IGNORE INTO races (race_id, name) VALUES(1, 'Rennen 1')")
+        self.__dbCursor.execute("INSERT OR IGNORE INTO races (race_id, name) VALUES(?, ?)", (race, f"Rennen {race}"))
+        self.__dbConnection.commit()
+        self.__race = race
+
+    def __createCaptureView(self):
+        """
+        Create the view `erfassung` with an INSTEAD OF trigger.
+        One INSERT into the view writes the meta audit row (only if the number exists),
+        moves the old time into backup1 / backup2 and stores the new time.
+        """
+        sql = "CREATE VIEW IF NOT EXISTS erfassung AS " \
+            "SELECT race_id, nummer, timeString, h, min, sec, secToday, '' AS name FROM zeiten"
+        self.__dbCursor.execute(sql)
+        sql = "CREATE TRIGGER IF NOT EXISTS erfassung_insert INSTEAD OF INSERT ON erfassung " \
+            "BEGIN " \
+            "INSERT INTO meta (timeString, h, min, sec, name, int, data, race_id) " \
+            "SELECT NEW.timeString, NEW.h, NEW.min, NEW.sec, NEW.name, nummer, " \
+            "'from ' || timeString || ' to ' || NEW.timeString, race_id " \
+            "FROM zeiten WHERE race_id = NEW.race_id AND nummer = NEW.nummer; " \
+            "INSERT INTO zeiten (race_id, nummer, timeString, h, min, sec, secToday, backup1, backup2) " \
+            "VALUES (NEW.race_id, NEW.nummer, NEW.timeString, NEW.h, NEW.min, NEW.sec, NEW.secToday, 0, 0) " \
+            "ON CONFLICT(race_id, nummer) DO UPDATE SET " \
+            "timeString = excluded.timeString, h = excluded.h, min = excluded.min, sec = excluded.sec, " \
+            "secToday = excluded.secToday, backup1 = secToday, backup2 = backup1; " \
+            "END"
+        self.__dbCursor.execute(sql)
+        self.__dbConnection.commit()
+
+    def __createChangelog(self):
+        """
+        Create the table changelog, filled by triggers on zeiten.
+        Every insert (I), update (U) and delete (D) of a number gets a new sequence number,
+        which is used for the delta export.
+        """
+        sql = "CREATE TABLE IF NOT EXISTS changelog(" \
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, " \
+            "nummer INTEGER, " \
+            "op TEXT, " \
+            "timeString TEXT, " \
+            "secToday INTEGER, " \
+            "race_id INTEGER NOT NULL DEFAULT 1)"
+        self.__dbCursor.execute(sql)
+        sql = "CREATE TRIGGER IF NOT EXISTS zeiten_changelog_insert AFTER INSERT ON zeiten " \
+            "BEGIN " \
+            "INSERT INTO changelog (nummer, op, timeString, secToday, race_id) " \
+            "VALUES (NEW.nummer, 'I', NEW.timeString, NEW.secToday, NEW.race_id); " \
+            "END"
+        self.__dbCursor.execute(sql)
+        sql = "CREATE TRIGGER IF NOT EXISTS zeiten_changelog_update AFTER UPDATE ON zeiten " \
+            "BEGIN " \
+            "INSERT INTO changelog (nummer, op, timeString, secToday, race_id) " \
+            "VALUES (NEW.nummer, 'U', NEW.timeString, NEW.secToday, NEW.race_id); " \
+            "END"
+        self.__dbCursor.execute(sql)
+        sql = "CREATE TRIGGER IF NOT EXISTS zeiten_changelog_delete AFTER DELETE ON zeiten " \
+            "BEGIN " \
+            "INSERT INTO changelog (nummer, op, timeString, secToday, race_id) " \
+            "VALUES (OLD.nummer, 'D', NULL, NULL, OLD.race_id); " \
+            "END"
+        self.__dbCursor.execute(sql)
+        self.__dbConnection.commit()
+
+    def __createMirror(self):
+        """
+        Create the table mirror for the times replicated from the other stations.
+        It is only written by applyMirror(). Deleted numbers keep their row with
+        secToday NULL, so MAX(seq) is the position of the replication.
+        """
+        sql = "CREATE TABLE IF NOT EXISTS mirror(" \
+            "station TEXT, " \
+            "race_id INTEGER NOT NULL DEFAULT 1, " \
+            "nummer INTEGER, " \
+            "secToday REAL, " \
+            "seq INTEGER, " \
+            "PRIMARY KEY (station, race_id, nummer))"
+        self.__dbCursor.execute(sql)
+        self.__dbConnection.commit()
+
+    def __storageProfile(self, config: RveZeitConfig) -> list:
+        """
+        Build the pragma statements of the storage profile from the [DB] section.
+        """
+        pragmas = []
+        journalMode = config.get("db.JournalMode")
+        if journalMode:
+            if journalMode.upper() in self.__journalModes:
+                pragmas.append(f"PRAGMA journal_mode = {journalMode.upper()}")
+            else:
+                print(f"ERROR: Invalid DB.JournalMode '{journalMode}'.")
+        synchronous = config.get("db.Synchronous")
+        if synchronous:
+            if synchronous.upper() in self.__synchronousModes:
+                pragmas.append(f"PRAGMA synchronous = {synchronous.upper()}")
+            else:
+                print(f"ERROR: Invalid DB.Synchronous '{synchronous}'.")
+        mmapSize = config.get("db.MmapSize")
+        if mmapSize is not None:
+            pragmas.append(f"PRAGMA mmap_size = {int(mmapSize)}")
+        cacheSize = config.get("db.CacheSize")
+        if cacheSize is not None:
+            pragmas.append(f"PRAGMA cache_size = {int(cacheSize)}")
+        return pragmas
+
+    def __connect(self, sqliteFile: str):
+        """
+        Open a connection and apply the storage profile.
+        """
+        connection = sqlite3.connect(sqliteFile)
+        for pragma in self.__pragmas:
+            connection.execute(pragma)
+        return connection
+
+    def checkpoint(self):
+        """
+        Write all pending operations and transfer the WAL into the database file,
+        so the database file can be copied as a consistent snapshot.
+        """
+        self.flush()
+        if self.__dbConnection:
+            self.__dbConnection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def exportSnapshot(self, compression: str = None) -> str:
+        """
+        Export the database for the transfer and return the name of the exported file.
+        gzip / lzma: a compacted copy (VACUUM INTO, without free pages) is compressed
+        as stream into <database>.gz / <database>.xz.
+        Otherwise the database file itself is checkpointed and its name returned.
+        """
+        compressors = {
+            "gzip": (gzip.open, ".gz"),
+            "lzma": (lzma.open, ".xz")
+        }
+        if not self.__dbConnection:
+            return None
+        if not compression or compression.lower() not in compressors:
+            self.checkpoint()
+            return self.__sqliteFile
+        compressor, extension = compressors[compression.lower()]
+        self.flush()
+        copyName = f"{self.__sqliteFile}.snapshot"
+        exportName = f"{self.__sqliteFile}{extension}"
+        try:
+            if os.path.exists(copyName):
+                os.remove(copyName)
+            self.__dbConnection.execute("VACUUM INTO ?", (copyName,))
+            with open(copyName, "rb") as source, compressor(f"{exportName}.tmp", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.replace(f"{exportName}.tmp", exportName)
+            return exportName
+        except Exception as e:
+            print(f"ERROR: Database export {exportName} failed: {e}")
+            return None
+        finally:
+            if os.path.exists(copyName):
+                os.remove(copyName)
+
+    # == write-behind ========================================================
+    def __startWriter(self, sqliteFile: str):
+        """
+        Start the writer thread. It owns its own connection and group-commits
+        all operations which are queued at the same time.
+        """
+        print("Database write-behind active.")
+        self.__writeQueue = queue.Queue()
+        self.__acknowledged = queue.Queue()
+        self.__writer = threading.Thread(target=self.__writerLoop, args=(sqliteFile,), name="DBWriter", daemon=True)
+        self.__writer.start()
+
+    def __writerLoop(self, sqliteFile: str):
+        connection = self.__connect(sqliteFile)
+        cursor = connection.cursor()
+        running = True
+        while running:
+            batch = [self.__writeQueue.get()]
+            while True:
+                try:
+                    batch.append(self.__writeQueue.get_nowait())
+                except queue.Empty:
+                    break
+            callbacks = []
+            errors = []
+            if not connection.in_transaction:
+                cursor.execute("BEGIN")
+            for item in batch:
+                if item is None:
+                    running = False
+                    continue
+                operation, args, callback = item
+                # a failed operation is rolled back completely, the others of the batch are committed
+                cursor.execute("SAVEPOINT operation")
+                try:
+                    operation(cursor, *args)
+                    cursor.execute("RELEASE operation")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO operation")
+                    cursor.execute("RELEASE operation")
+                    errors.append(f"Database write {operation.__name__}{args} failed: {e}")
+                    print(f"ERROR: {errors[-1]}")
+                if callback:
+                    callbacks.append(callback)
+            connection.commit()
+            # one acknowledgement per commit, also without callbacks, see processAcknowledgements
+            self.__acknowledged.put((callbacks, errors))
+            for item in batch:
+                self.__writeQueue.task_done()
+        connection.close()
+
+    def __write(self, operation, args: tuple, callback=None):
+        """
+        Execute a write operation. In write-behind mode it is queued for the writer thread
+        and the callback is called by processAcknowledgements() after the commit.
+        Otherwise it is committed directly and the callback is called immediately.
+        """
+        if self.__writeQueue is not None:
+            self.__writeQueue.put((operation, args, callback))
+        elif self.__dbCursor:
+            try:
+                operation(self.__dbCursor, *args)
+                self.__dbConnection.commit()
+            except Exception as e:
+                self.__dbConnection.rollback()
+                print(f"ERROR: Database write {operation.__name__}{args} failed: {e}")
+                self.__writeFailed([f"Database write {operation.__name__}{args} failed: {e}"])
+            if callback:
+                callback()
+
+    def onWriteError(self, hook):
+        """
+        Register hook(message: str), called in the thread which owns the UI when a write failed.
+        The index is loaded again before, so it only contains the stored rows.
+        """
+        self.__writeErrorHooks.append(hook)
+
+    def __writeFailed(self, errors: list):
+        # the index already contains the failed change: load it again as soon as the queue is empty
+        if self.__writeQueue is None or self.__writeQueue.unfinished_tasks == 0:
+            self.__loadIndex()
+        else:
+            self.__indexVersion = None
+        for error in errors:
+            for hook in self.__writeErrorHooks:
+                hook(error)
+
+    def flush(self):
+        """
+        Wait until all queued operations are committed and call their callbacks.
+        """
+        if self.__writeQueue is not None:
+            self.__writeQueue.join()
+            self.processAcknowledgements()
+
+    def processAcknowledgements(self):
+        """
+        Call the callbacks of all committed and failed operations, failed operations
+        are reported to the hooks of onWriteError() first.
+        Has to be called from the thread which owns the UI.
+        """
+        if self.__acknowledged is not None:
+            committed = False
+            failed = False
+            while True:
+                try:
+                    callbacks, errors = self.__acknowledged.get_nowait()
+                except queue.Empty:
+                    break
+                committed = True
+                if errors:
+                    failed = True
+                    self.__writeFailed(errors)
+                for callback in callbacks:
+                    callback()
+            # the commits of the writer thread change the data_version, too
+            if committed and not failed and self.__indexVersion is not None and self.__writeQueue is not None \
+                    and self.__writeQueue.unfinished_tasks == 0:
+                self.__indexVersion = self.__dataVersion()
+
+    # == races ===============================================================
+    def getRace(self) -> int:
+        """
+        Race of all reads and writes.
+        """
+        return self.__race
+
+    def getRaces(self) -> list:
+        """
+        All races: [(race_id, name), ...] ordered by race_id.
+        """
+        result = []
+        if self.__dbCursor:
+            self.flush()
+            self.__dbCursor.execute("SELECT race_id, name FROM races ORDER BY race_id")
+            result = self.__dbCursor.fetchall()
+        return result
+
+    def addRace(self, name: str) -> int:
+        """
+        Create a new race, returns its race_id.
+        """
+        raceId = None
+        if self.__dbCursor:
+            self.flush()
+            self.__dbCursor.execute("INSERT INTO races (name) VALUES(?)", (name,))
+            raceId = self.__dbCursor.lastrowid
+            self.__dbConnection.commit()
+        return raceId
+
+    def setRace(self, raceId: int):
+        """
+        Switch to another race. Pending operations are written to the old race first.
+        """
+        if raceId != self.__race:
+            self.flush()
+            self.__race = raceId
+            self.__loadIndex()
+
+    # == in-memory index =====================================================
+    def __loadIndex(self):
+        """
+        Load all rows of zeiten of the race into the in-memory index.
+        """
+        self.__index = {}
+        if self.__dbCursor:
+            self.__indexVersion = self.__dataVersion()
+            sql = "SELECT nummer, timeString, h, min, sec, secToday, backup1, backup2 FROM zeiten WHERE race_id = ?"
+            self.__dbCursor.execute(sql, (self.__race,))
+            for satz in self.__dbCursor:
+                self.__index[satz[0]] = satz
+
+    def __dataVersion(self) -> int:
+        self.__dbCursor.execute("PRAGMA data_version")
+        return self.__dbCursor.fetchone()[0]
+
+    def __checkIndex(self):
+        """
+        Reload the index if the database was changed by another program.
+        While own writes are pending the index is ahead of the database and is kept.
+        """
+        # commits of the writer thread which were not acknowledged yet are no external change
+        self.processAcknowledgements()
+        if self.__dbCursor and (self.__writeQueue is None or self.__writeQueue.unfinished_tasks == 0):
+            if self.__dataVersion() != self.__indexVersion:
+                print("Database changed externally, reload index.")
+                self.__loadIndex()
+
+    def __indexKey(self, nummer: str) -> int:
+        try:
+            return int(nummer)
+        except (TypeError, ValueError):
+            return None
+
+    def __indexCapture(self, nummer: str, timeString: str, hour: int, minuten: int, sekunden: int,
+                       secToday: int):
+        """
+        Apply a capture to the index the same way the erfassung trigger does in the database.
+        """
+        key = self.__indexKey(nummer)
+        if key is not None:
+            old = self.__index.get(key)
+            if old is None:
+                self.__index[key] = (key, timeString, hour, minuten, sekunden, secToday, 0, 0)
+            else:
+                self.__index[key] = (key, timeString, hour, minuten, sekunden, secToday, old[5], old[6])
+
+    # == mirror of the other stations =======================================
+    def __loadMirror(self):
+        self.__mirror = {}
+        self.__mirrorSeq = {}
+        if self.__dbCursor:
+            self.__dbCursor.execute("SELECT station, race_id, nummer, secToday, seq FROM mirror")
+            for station, race, nummer, secToday, seq in self.__dbCursor:
+                if secToday is not None:
+                    self.__mirror.setdefault(station, {})[(race, nummer)] = secToday
+                self.__mirrorSeq[station] = max(seq, self.__mirrorSeq.get(station, 0))
+
+    def getMirrorSeq(self, station: str) -> int:
+        """
+        Last changelog sequence number of the station which is in the mirror.
+        """
+        return self.__mirrorSeq.get(station, 0)
+
+    def getMirrorTime(self, station: str, nummer: int):
+        """
+        Replicated time of the number in the current race at the station, None if unknown.
+        """
+        return self.__mirror.get(station, {}).get((self.__race, nummer))
+
+    def getMirrorNumbers(self, station: str) -> set:
+        """
+        Numbers of the current race with a replicated time of the station.
+        """
+        return {nummer for race, nummer in self.__mirror.get(station, {}) if race == self.__race}
+
+    def applyMirror(self, station: str, changes: list, reset: bool = False, callback=None):
+        """
+        Apply replicated changes (seq, nummer, op, secToday, race) of the station.
+        Changes without race belong to race 1 (stations of older versions).
+        reset removes all times of the station first (its database was replaced).
+        Changes which are not newer than the mirror are ignored.
+        """
+        if reset:
+            self.__mirror.pop(station, None)
+            self.__mirrorSeq.pop(station, None)
+        rows = []
+        times = self.__mirror.setdefault(station, {})
+        for change in changes:
+            seq, nummer, op, secToday = change[:4]
+            race = change[4] if len(change) > 4 else 1
+            if seq <= self.__mirrorSeq.get(station, 0):
+                continue
+            if op == "D":
+                secToday = None
+                times.pop((race, nummer), None)
+            else:
+                times[(race, nummer)] = secToday
+            self.__mirrorSeq[station] = seq
+            rows.append((station, race, nummer, secToday, seq))
+        if rows or reset:
+            self.__write(self.__applyMirror, (station, rows, reset), callback)
+
+    def __applyMirror(self, cursor, station: str, rows: list, reset: bool):
+        if reset:
+            cursor.execute("DELETE FROM mirror WHERE station = ?", (station,))
+        sql = "INSERT OR REPLACE INTO mirror (station, race_id, nummer, secToday, seq) VALUES(?, ?, ?, ?, ?)"
+        cursor.executemany(sql, rows)
+
+    def hasNumber(self, nummer: str) -> bool:
+        """
+        Check if the number is already stored, without database access.
+        """
+        self.__checkIndex()
+        return self.__indexKey(nummer) in self.__index
 
     def getMaxMeta(self) -> int:
         """
@@ -91,8 +636,8 @@ class DB:
         """
         maxNumber = 0
         if self.__dbCursor:
-            sql = "SELECT MAX(nummer) FROM zeiten"
-            self.__dbCursor.execute(sql)
+            sql = "SELECT MAX(nummer) FROM zeiten WHERE race_id = ?"
+            self.__dbCursor.execute(sql, (self.__race,))
             maxNumber = self.__dbCursor.fetchone()[0]
             if (maxNumber is None):
                 maxNumber = 0
@@ -105,80 +650,122 @@ class DB:
         """
         row = None
         if self.__dbCursor and nummer is not None and nummer != "":
-            sql = f"SELECT * FROM zeiten WHERE nummer = {nummer}"
-            self.__dbCursor.execute(sql)
-            row = self.__dbCursor.fetchone()
+            self.__checkIndex()
+            row = self.__index.get(self.__indexKey(nummer))
         return row
 
     def insertDataByNumber(self, nummer: str, timeString: str, hour: int, minuten: int,
-                           sekunden: int, secToday: int, backup1: int = 0, backup2: int = 0):
+                           sekunden: int, secToday: int, backup1: int = 0, backup2: int = 0, callback=None):
         """
         create new zeiten entry
         """
-        if self.__dbCursor and nummer is not None and nummer != "":
-            sql = "INSERT INTO zeiten " \
-                + "(nummer, timeString, h, min, sec, secToday, backup1, backup2)" \
-                + f"VALUES( '{nummer}', '{timeString}', {hour}, {minuten}, {sekunden}, " \
-                + f"{secToday}, {backup1}, {backup2})"
-            # print(sql)
-            self.__dbCursor.execute(sql)
-            self.__dbConnection.commit()
+        if nummer is not None and nummer != "":
+            key = self.__indexKey(nummer)
+            if key is not None:
+                self.__index[key] = (key, timeString, hour, minuten, sekunden, secToday, backup1, backup2)
+            self.__write(self.__insert, (self.__race, nummer, timeString, hour, minuten, sekunden, secToday,
+                                         backup1, backup2), callback)
+
+    def __insert(self, cursor, race: int, nummer: str, timeString: str, hour: int, minuten: int,
+                 sekunden: int, secToday: int, backup1: int = 0, backup2: int = 0):
+        sql = "INSERT INTO zeiten " \
+            "(race_id, nummer, timeString, h, min, sec, secToday, backup1, backup2) " \
+            "VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        cursor.execute(sql, (race, nummer, timeString, hour, minuten, sekunden, secToday, backup1, backup2))
 
     def updateDataByNumber(self, nummer: str, timeString: str, hour: int, minuten: int,
-                           sekunden: int, secToday: int, backup1: int = 0,
-                           backup2: int = 0, oldSecToday: int = 0, comment: str = "New time for"):
+                           sekunden: int, secToday: int, comment: str = "Change time of", callback=None):
         """
-        update new zeiten entry
+        update zeiten entry.
+        The old time moves to backup1 / backup2 and the change is logged in meta.
         """
-        if self.__dbCursor and nummer is not None and nummer != "":
-            sql = "UPDATE zeiten SET " \
-                + f"timeString = '{timeString}', " \
-                + f"h = {hour}, min = {minuten}, sec = {sekunden}, secToday = {secToday}" \
-                + f", backup1 = {backup1}, backup2 = {backup2} " \
-                + f"WHERE nummer = {nummer}"
-            # print(sql)
-            self.__dbCursor.execute(sql)
-
-            # -------------------------- M E T A   - Eintrag   --------
-            sql = "INSERT INTO meta " \
-                + "(timeString, h, min, sec, name, int, data) " \
-                + f"VALUES( '{timeString}', {hour}, {minuten}, {sekunden}, " \
-                + f"'{comment}', {nummer}, 'from {oldSecToday} to {timeString}')"
-            # print(sql)
-            self.__dbCursor.execute(sql)
-            self.__dbConnection.commit()
+        if nummer is not None and nummer != "":
+            self.__indexCapture(nummer, timeString, hour, minuten, sekunden, secToday)
+            self.__write(self.__capture, (self.__race, nummer, timeString, hour, minuten, sekunden, secToday, comment),
+                         callback)
 
     def upsertDataByNumber(self, nummer: str, timeString: str, hour: int, minuten: int, sekunden: int,
-                           secToday: int, backup1: int = 0, backup2: int = 0):
+                           secToday: int, callback=None):
         """
         Insert or update data entry depending if number already exists in database.
         """
-        row = self.getDataByNumber(nummer)
-        if row is None:
-            self.insertDataByNumber(nummer, timeString, hour, minuten, sekunden, secToday)
-        else:
-            self.updateDataByNumber(nummer, timeString, hour, minuten, sekunden, secToday,
-                                    backup1=row[5], backup2=row[6], oldSecToday=row[1])
+        if nummer is not None and nummer != "":
+            self.__indexCapture(nummer, timeString, hour, minuten, sekunden, secToday)
+            self.__write(self.__capture, (self.__race, nummer, timeString, hour, minuten, sekunden, secToday,
+                                          "New time for"), callback)
 
-    def deleteDataByNumber(self, nummer: str):
+    def __capture(self, cursor, race: int, nummer: str, timeString: str, hour: int, minuten: int, sekunden: int,
+                  secToday: int, comment: str):
+        # one statement, the trigger of the view does the history and the upsert
+        sql = "INSERT INTO erfassung (race_id, nummer, timeString, h, min, sec, secToday, name) " \
+            "VALUES(?, ?, ?, ?, ?, ?, ?, ?)"
+        cursor.execute(sql, (race, nummer, timeString, hour, minuten, sekunden, secToday, comment))
+
+    def deleteDataByNumber(self, nummer: str, callback=None):
         """
         Delete data entry from database
         """
-        if self.__dbCursor and nummer is not None and nummer != "":
-            sql1 = f"delete from meta where int = {str(nummer)}"
-            sql2 = f"delete from zeiten where nummer =  {str(nummer)}"
-            self.__dbCursor.execute(sql1)
-            self.__dbCursor.execute(sql2)
-            self.__dbConnection.commit()
+        if nummer is not None and nummer != "":
+            self.__index.pop(self.__indexKey(nummer), None)
+            self.__write(self.__delete, (self.__race, nummer), callback)
 
-    def getAllData(self) -> list:
+    def __delete(self, cursor, race: int, nummer: str):
+        sql1 = "delete from meta where race_id = ? and int = ?"
+        sql2 = "delete from zeiten where race_id = ? and nummer = ?"
+        cursor.execute(sql1, (race, nummer))
+        cursor.execute(sql2, (race, nummer))
+
+    def getLastChange(self) -> int:
         """
-        get alle zeiten einträge
+        Sequence number of the last change in the changelog.
+        """
+        lastChange = 0
+        if self.__dbCursor:
+            self.flush()
+            self.__dbCursor.execute("SELECT MAX(seq) FROM changelog")
+            lastChange = self.__dbCursor.fetchone()[0]
+            if lastChange is None:
+                lastChange = 0
+        return lastChange
+
+    def getChangesSince(self, seq: int) -> list:
+        """
+        get the changes of the race after the given sequence number, only the last change of every number.
+        Rows: (seq, nummer, op, timeString, secToday), ordered by seq.
         """
         result = []
         if self.__dbCursor:
-            sql = "SELECT * FROM zeiten ORDER BY secToday desc"
-            self.__dbCursor.execute(sql)
-            for satz in self.__dbCursor:
-                result.append(satz)
+            self.flush()
+            sql = "SELECT MAX(seq), nummer, op, timeString, secToday FROM changelog " \
+                "WHERE seq > ? AND race_id = ? GROUP BY nummer ORDER BY 1"
+            self.__dbCursor.execute(sql, (seq, self.__race))
+            result = self.__dbCursor.fetchall()
         return result
+
+    def getAllData(self) -> list:
+        """
+        get alle zeiten einträge
+        """
+        return list(self.iterAllData())
+
+    def iterAllData(self):
+        """
+        Generator over all zeiten einträge of the race, streamed from the database.
+        Uses its own cursor, so other queries can run while iterating.
+        The index zeiten_race_time delivers the rows in this order without sorting.
+        """
+        if self.__dbConnection:
+            self.flush()
+            cursor = self.__dbConnection.cursor()
+            try:
+                sql = "SELECT nummer, timeString, h, min, sec, secToday, backup1, backup2 FROM zeiten " \
+                    "WHERE race_id = ? ORDER BY secToday desc, nummer"
+                cursor.execute(sql, (self.__race,))
+                for satz in cursor:
+                    yield satz
+            finally:
+                try:
+                    cursor.close()
+                except sqlite3.ProgrammingError:
+                    # database already closed
+                    pass
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# export of the captured times into .trz and .delta files, without user interface
+import os
+
+import RveZeitDB
+
+
+def formatTime(secToday: float, decimals: int = 0) -> str:
+    """
+    Format seconds of the day as HH:MM:SS with the given number of decimals.
+    Decimals are truncated, not rounded.
+    """
+    whole = int(secToday)
+    timeString = f"{str(whole // 3600).zfill(2)}:{str(whole // 60 % 60).zfill(2)}:{str(whole % 60).zfill(2)}"
+    if decimals > 0:
+        milliseconds = min(999, int(round((secToday - whole) * 1000)))
+        fraction = milliseconds // 10**(3 - decimals)
+        timeString = f"{timeString}.{str(fraction).zfill(decimals)}"
+    return timeString
+
+
+def raceFileName(fileName: str, race: int) -> str:
+    """
+    Name of the export file of the race: the configured name for race 1,
+    '<name>.race<race>.<extension>' for the other races.
+    """
+    if race == 1:
+        return fileName
+    base, extension = os.path.splitext(fileName)
+    return f"{base}.race{race}{extension}"
+
+
+def writeTrzFile(db: RveZeitDB, fileName: str, decimals: int = 0) -> bool:
+    lines = (f"{str(satz[0]).zfill(4)}\t{formatTime(satz[5], decimals)}\n" for satz in db.iterAllData())
+    return writeFile(fileName, lines)
+
+
+def writeDeltaFile(db: RveZeitDB, position: str, fromSeq: int, toSeq: int, decimals: int = 3) -> str:
+    """
+    Write the changes of the current race after fromSeq up to toSeq into a sequence numbered delta file.
+    Changed numbers get their current time, deleted numbers a '-'.
+    The deltas replace the database upload, so the times keep their milliseconds
+    independent of TimeDecimals.
+    Returns the name of the file or None.
+    """
+    fileName = f"{position}.{str(toSeq).zfill(6)}.delta"
+
+    def lines():
+        yield f"# RVEZeit delta {position} {fromSeq} {toSeq} {db.getRace()}\n"
+        for change in db.getChangesSince(fromSeq):
+            if change[0] > toSeq:
+                continue
+            if change[2] == "D":
+                yield f"{str(change[1]).zfill(4)}\t-\n"
+            else:
+                yield f"{str(change[1]).zfill(4)}\t{formatTime(change[4], decimals)}\n"
+
+    if writeFile(fileName, lines()):
+        return fileName
+    return None
+
+
+def writeFile(fileName: str, lines) -> bool:
+    """
+    Write the lines buffered into a temporary file and rename it to fileName,
+    so there is never a partially written file.
+    """
+    tempName = f"{fileName}.tmp"
+    try:
+        with open(tempName, "w", buffering=65536) as file:
+            file.writelines(lines)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tempName, fileName)
+        return True
+    except Exception as e:
+        print(f"ERROR: Writing {fileName} failed: {e}")
+        try:
+            os.remove(tempName)
+        except OSError:
+            pass
+        return False
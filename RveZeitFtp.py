@@ -6,45 +6,177 @@ Created on 18.3.2023
 """
 # ftp export
 import ftplib
+import io
+import os
+import threading
 
 import RveZeitConfig
+import RveZeitTransport
 
 
-class FTP:
+class FTP(RveZeitTransport.Transport):
     """
-    Class to handle ftp calls
+    Class to handle ftp calls.
+    Connections are kept in a pool and kept alive with NOOP, files are uploaded
+    concurrently by the worker threads of the transport.
+    Uploads go to a temporary name, are resumed after errors and renamed when complete.
     """
 
-    __config = None
+    _name = "FTP"
 
     def __init__(self, config: RveZeitConfig):
-        self.__config = config
-
-    def sendFile(self, files: list) -> bool:
-        """
-        send given files via FTP
-        """
-        print(f"Send {files} via FTP")
-        result = False
-        if self.__config:
-            ftpServer = self.__config.get("ftp.FTPserver")
-            ftpUser = self.__config.get("ftp.FTPuser")
-            ftpPasswd = self.__config.get("ftp.FTPpasswd")
-            ftpDir = self.__config.get("ftp.FTPdir")
-            if ftpServer and ftpUser and ftpPasswd and ftpDir is not None:
-                session = ftplib.FTP(ftpServer, ftpUser, ftpPasswd)
-                if ftpDir:
-                    session.cwd(ftpDir)
-                # assume it works
-                result = True
-                for file in files:
-                    try:
-                        with open(file, 'rb') as fp:                        # file to send
-                            session.storbinary('STOR ' + file, fp)          # send the file
-                            fp.close()                                      # close file and FTP
-                    except Exception:
-                        result = False
+        RveZeitTransport.Transport.__init__(self, config)
+        self.__pool = []
+        self.__poolLock = threading.Lock()
+        self.__stop = threading.Event()
+        # file -> (size, mtime) of the local file whose upload left the .part on the server
+        self.__parts = {}
+        keepAlive = config.get("ftp.KeepAlive")
+        if keepAlive:
+            threading.Thread(target=self.__keepAliveLoop, args=(keepAlive,), name="FTPKeepAlive",
+                             daemon=True).start()
+
+    def close(self):
+        """
+        Wait for running transfers and close all pooled connections.
+        """
+        self.__stop.set()
+        RveZeitTransport.Transport.close(self)
+        with self.__poolLock:
+            sessions = self.__pool
+            self.__pool = []
+        for session in sessions:
+            try:
                 session.quit()
-        if result:
-            print("FTP Transfer erfolgreich !")
-        return result
+            except Exception:
+                pass
+
+    def _upload(self, file: str, report):
+        """
+        Upload a file with a pooled connection. See __uploadVerified.
+        """
+        session = self.__getSession()
+        try:
+            self.__uploadVerified(session, file, report)
+        except Exception:
+            self.__discardSession(session)
+            raise
+        self.__releaseSession(session)
+
+    def __uploadVerified(self, session, file: str, report):
+        """
+        Upload into a temporary name, resume with REST after the part which is already
+        on the server, check the size and rename to the final name. A .sha256 sidecar
+        with the checksum of the file is renamed into place after the file itself,
+        so a reader never sees a half written file.
+        Only a .part of the same local file (size and mtime) is resumed, e.g. by the retries.
+        A .part left by an earlier export or an earlier run is deleted.
+        """
+        tempName = f"{file}.part"
+        stat = os.stat(file)
+        size = stat.st_size
+        session.voidcmd("TYPE I")
+        offset = None
+        if self.__parts.get(file) == (size, stat.st_mtime_ns):
+            offset = self.__remoteSize(session, tempName)
+        else:
+            self.__parts[file] = (size, stat.st_mtime_ns)
+            try:
+                session.delete(tempName)
+            except ftplib.error_perm:
+                # no .part on the server
+                pass
+        if offset is None or offset > size:
+            offset = 0
+        sent = [offset]
+
+        def block(data):
+            sent[0] += len(data)
+            report(sent[0])
+
+        with open(file, 'rb') as fp:                                        # file to send
+            fp.seek(offset)
+            session.storbinary('STOR ' + tempName, fp, self._blockSize, block,
+                               rest=offset if offset > 0 else None)         # send the file
+        remoteSize = self.__remoteSize(session, tempName)
+        if remoteSize != size:
+            raise ftplib.Error(f"size of {tempName} on server is {remoteSize}, expected {size}")
+
+        sidecar = self._checksum(file).encode()
+        session.storbinary(f"STOR {file}.sha256.part", io.BytesIO(sidecar))
+
+        self.__rename(session, tempName, file)
+        self.__parts.pop(file, None)
+        self.__rename(session, f"{file}.sha256.part", f"{file}.sha256")
+
+    def __remoteSize(self, session, name: str) -> int:
+        try:
+            return session.size(name)
+        except ftplib.error_perm:
+            return None
+
+    def __rename(self, session, fromName: str, toName: str):
+        """
+        RNFR / RNTO, removes an existing target first if the server does not overwrite it.
+        """
+        try:
+            session.rename(fromName, toName)
+        except ftplib.error_perm:
+            session.delete(toName)
+            session.rename(fromName, toName)
+
+    # == connection pool =====================================================
+    def _configured(self) -> bool:
+        ftpServer = self._config.get("ftp.FTPserver")
+        ftpUser = self._config.get("ftp.FTPuser")
+        ftpPasswd = self._config.get("ftp.FTPpasswd")
+        ftpDir = self._config.get("ftp.FTPdir")
+        return bool(ftpServer and ftpUser and ftpPasswd and ftpDir is not None)
+
+    def __connect(self):
+        ftpDir = self._config.get("ftp.FTPdir")
+        session = ftplib.FTP(self._config.get("ftp.FTPserver"), self._config.get("ftp.FTPuser"),
+                             self._config.get("ftp.FTPpasswd"), timeout=self._config.get("ftp.Timeout"))
+        if ftpDir:
+            session.cwd(ftpDir)
+        return session
+
+    def __getSession(self):
+        """
+        Take a living connection from the pool or open a new one.
+        """
+        while True:
+            with self.__poolLock:
+                session = self.__pool.pop() if self.__pool else None
+            if session is None:
+                return self.__connect()
+            try:
+                session.voidcmd("NOOP")
+                return session
+            except Exception:
+                self.__discardSession(session)
+
+    def __releaseSession(self, session):
+        with self.__poolLock:
+            self.__pool.append(session)
+
+    def __discardSession(self, session):
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def __keepAliveLoop(self, interval: int):
+        """
+        Send NOOP on the idle connections, so the server does not close them.
+        """
+        while not self.__stop.wait(interval):
+            with self.__poolLock:
+                sessions = self.__pool
+                self.__pool = []
+            for session in sessions:
+                try:
+                    session.voidcmd("NOOP")
+                    self.__releaseSession(session)
+                except Exception:
+                    self.__discardSession(session)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# capture without user interface, e.g. a Raspberry Pi with a hardware button
+import os
+import queue
+import stat
+import sys
+import threading
+import time
+
+import RveZeitClock
+import RveZeitConfig
+import RveZeitCore
+import RveZeitDB
+import RveZeitExport
+
+
+class Headless:
+    """
+    Captures times from lines of stdin or of an event file, without Tk.
+    Every line is read by its own thread and gets its timestamp as soon as it arrives:
+
+        <nummer>            capture the number
+        <nummer> <epoch>    capture the number at the given time (time.time() of the writer)
+        (empty) or +        capture the next number, e.g. a button which writes a newline
+        t                   transfer .trz and database
+        q                   quit
+
+    Capture, export (also ExportMode delta) and automatic transfer are done by
+    RveZeitCore, the same way as with the user interface.
+    """
+
+    # seconds between the polls of the background events
+    __poll = 0.05
+
+    def __init__(self, config: RveZeitConfig, db: RveZeitDB, transport=None, replication=None):
+        self.__config = config
+        self.__db = db
+        self.__core = RveZeitCore.Core(config, db, transport, replication)
+        self.__core.setTransferHandlers(done=self.__transferDone)
+        self.__lines = queue.Queue()
+        self.__clock = RveZeitClock.Clock()
+        self.__nextNumber = db.getMaxNumber() + 1
+
+    def run(self, eventFile: str = None):
+        """
+        Capture until q or the end of the input.
+        """
+        if eventFile and not os.path.exists(eventFile):
+            print(f"ERROR: Event file {eventFile} does not exist")
+            return
+        if eventFile:
+            reader = threading.Thread(target=self.__readEventFile, args=(eventFile,), name="EventReader",
+                                      daemon=True)
+        else:
+            reader = threading.Thread(target=self.__readStream, args=(sys.stdin,), name="StdinReader",
+                                      daemon=True)
+        reader.start()
+        print(f"Headless capture {self.__config.get('data.Position')}, race {self.__db.getRace()}, "
+              f"next number {self.__nextNumber}")
+        interval = self.__config.get("ftp.AutoSyncInterval")
+        nextSync = time.monotonic() + interval if interval else None
+        running = True
+        while running:
+            try:
+                line, secToday = self.__lines.get(timeout=self.__poll)
+                running = self.__handle(line, secToday)
+            except queue.Empty:
+                pass
+            self.__clock.check()
+            self.__core.processEvents()
+            if nextSync and time.monotonic() >= nextSync:
+                nextSync = time.monotonic() + interval
+                self.__core.autoSync()
+        self.__db.flush()
+
+    def __handle(self, line: str, secToday: float) -> bool:
+        if line is None:
+            return False
+        fields = line.split()
+        if fields == ["q"]:
+            return False
+        if fields == ["t"]:
+            if not self.__core.isTransferRunning() and not self.__core.startTransfer(manual=True):
+                print("Export fehlgeschlagen")
+        elif not fields or fields == ["+"]:
+            self.__capture(self.__nextNumber, secToday)
+        elif fields[0].isdigit():
+            if len(fields) > 1:
+                try:
+                    secToday = RveZeitClock.epochSecToday(float(fields[1]))
+                except ValueError:
+                    print(f"ERROR: '{fields[1]}' is no time")
+                    return True
+            self.__capture(int(fields[0]), secToday)
+        else:
+            print(f"ERROR: unknown input '{line.strip()}'")
+        return True
+
+    def __capture(self, nummer: int, secToday: float):
+        self.__core.capture(str(nummer), secToday)
+        self.__nextNumber = nummer + 1
+        print(f"{str(nummer).zfill(4)}\t{RveZeitExport.formatTime(secToday, 3)}")
+        sys.stdout.flush()
+
+    # == input ===============================================================
+    def __readStream(self, stream):
+        """
+        Queue every line with the time it was read. None marks the end of the input.
+        """
+        for line in stream:
+            self.__lines.put((line, self.__clock.secToday()))
+        self.__lines.put((None, None))
+
+    def __readEventFile(self, eventFile: str):
+        """
+        Read a named pipe (opened again when the writer closed it) or follow a file
+        to which the events are appended.
+        """
+        if stat.S_ISFIFO(os.stat(eventFile).st_mode):
+            while True:
+                with open(eventFile) as stream:
+                    for line in stream:
+                        self.__lines.put((line, self.__clock.secToday()))
+        with open(eventFile) as stream:
+            stream.seek(0, os.SEEK_END)
+            line = ""
+            while True:
+                line += stream.readline()
+                if line.endswith("\n"):
+                    self.__lines.put((line, self.__clock.secToday()))
+                    line = ""
+                else:
+                    time.sleep(0.01)
+
+    # == transfer ============================================================
+    def __transferDone(self, fileName: str, result: bool, manual: bool):
+        if result:
+            print(f"Übertragen {time.strftime('%H:%M:%S')}")
+        else:
+            print(f"Übertragung von {fileName} fehlgeschlagen")
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# compiles the UI layout file into a flat build plan
+import hashlib
+import json
+import os
+
+# kinds of the build steps, the UI has its builders in the same order
+WIDGET_KINDS = ("label", "entry", "button", "radiobutton", "frame", "scrollbar", "listbox", "timeline",
+                "combobox")
+MENU, CASCADE, SEPARATOR, COMMAND = range(len(WIDGET_KINDS), len(WIDGET_KINDS) + 4)
+# geometry manager of a step
+GEOMETRY_NONE, GEOMETRY_PLACE, GEOMETRY_PACK = range(3)
+# validation of an entry
+VALIDATION_KINDS = ("integer", "hour", "minute")
+
+# increased when the format of the plan changes, invalidates the caches
+PLAN_VERSION = 2
+CACHE_FILE = "RVEZeit.layout.cache"
+
+
+def load(layoutFile: str, inputGroups: int) -> dict:
+    """
+    Get the build plan of the layout file.
+    The plan is cached in CACHE_FILE, keyed by the hash of the layout file and the
+    parameters of the compilation, so the layout is only validated and compiled after changes.
+
+    plan = {
+        "geometry": "800x600", "resizable": {...},
+        "steps": [[kind, name, parent, options, extra, geometry, validation], ...],
+        "lazyFrom": index of the first lazy step
+    }
+    kind: index in WIDGET_KINDS or MENU, CASCADE, SEPARATOR, COMMAND
+    parent: index of the step of the parent, -1 for the window
+    options: options of the widget (cascade: of the sub menu, command: of add_command)
+    extra: place / pack options (cascade: options of add_cascade)
+    validation: None or [index in VALIDATION_KINDS, maximum length]
+    The steps are ordered so that every parent is built before its children,
+    all steps after lazyFrom are lazy.
+    """
+    with open(layoutFile, "rb") as file:
+        content = file.read()
+    key = hashlib.sha256(content + f"|{inputGroups}|{PLAN_VERSION}".encode()).hexdigest()
+    try:
+        with open(CACHE_FILE) as file:
+            cache = json.load(file)
+        if cache.get("key") == key:
+            return cache["plan"]
+    except (OSError, ValueError):
+        pass
+    plan = compileLayout(json.loads(content), inputGroups)
+    try:
+        with open(f"{CACHE_FILE}.tmp", "w") as file:
+            json.dump({"key": key, "plan": plan}, file)
+        os.replace(f"{CACHE_FILE}.tmp", CACHE_FILE)
+    except OSError as e:
+        print(f"ERROR: Layout cache {CACHE_FILE} can not be written: {e}")
+    return plan
+
+
+def compileLayout(layout: dict, inputGroups: int) -> dict:
+    """
+    Validate the layout and compile it into the build plan, see load().
+    Invalid elements are reported and left out.
+    """
+    core = []
+    lazy = []
+    for element in expandInputGroups(layout.get("uiElements", []), inputGroups):
+        _compileElement(element, "window", None, bool(element.get("lazy")), core, lazy)
+    menu = layout.get("menu")
+    if menu:
+        _compileMenu(menu, "window", bool(menu.get("lazy")), core, lazy)
+
+    # number the steps: core first, then lazy, parents are replaced by their index
+    steps = core + lazy
+    indexes = {step[1]: index for index, step in enumerate(steps)}
+    for step in steps:
+        step[2] = -1 if step[2] is None else indexes[step[2]]
+    return {
+        "geometry": layout.get("geometry"),
+        "resizable": layout.get("resizable"),
+        "steps": steps,
+        "lazyFrom": len(core)
+    }
+
+
+def expandInputGroups(elements: list, inputGroups: int) -> list:
+    """
+    Replace the element of type inputGroups by its uiElements, once per input group.
+    {n} is replaced by the number of the group, {key} by its key, the placement
+    is moved by step for every group.
+    """
+    result = []
+    for element in elements:
+        if element.get("type") != "inputGroups":
+            result.append(element)
+            continue
+        keys = element.get("keys", [])
+        step = element.get("step", {})
+        for number in range(inputGroups):
+            values = {"n": number + 1, "key": keys[number] if number < len(keys) else ""}
+            for template in element.get("uiElements", []):
+                copy = _format(template, values)
+                placement = copy.get("placement")
+                if placement:
+                    for coordinate, distance in step.items():
+                        placement[coordinate] = placement.get(coordinate, 0) + distance * number
+                result.append(copy)
+    return result
+
+
+def _format(value, values: dict):
+    if isinstance(value, str):
+        return value.format(**values)
+    if isinstance(value, dict):
+        return {key: _format(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_format(item, values) for item in value]
+    return value
+
+
+def _compileElement(element: dict, base: str, parent: str, lazy: bool, core: list, lazySteps: list):
+    if "name" not in element or "type" not in element:
+        print(f"ERROR: Layout element without name or type in {base}: {element}")
+        return
+    name = f"{base}.{element['name']}"
+    kind = element["type"].lower()
+    if kind not in WIDGET_KINDS:
+        print(f"ERROR: Layout element {name} has unknown type {element['type']}")
+        return
+    geometry, extra = GEOMETRY_NONE, None
+    if element.get("placement"):
+        geometry, extra = GEOMETRY_PLACE, element["placement"]
+    elif element.get("pack"):
+        geometry, extra = GEOMETRY_PACK, element["pack"]
+    validation = None
+    if element.get("validation"):
+        validationType = str(element["validation"].get("type", "")).lower()
+        if validationType in VALIDATION_KINDS:
+            validation = [VALIDATION_KINDS.index(validationType), element["validation"].get("length", 0)]
+        else:
+            print(f"ERROR: Layout element {name} has unknown validation {validationType}")
+    lazy = lazy or bool(element.get("lazy"))
+    (lazySteps if lazy else core).append([WIDGET_KINDS.index(kind), name, parent, element.get("properties", {}),
+                                          extra, geometry, validation])
+    for subElement in element.get("uiElements", []):
+        _compileElement(subElement, name, name, lazy, core, lazySteps)
+
+
+def _compileMenu(menu: dict, base: str, lazy: bool, core: list, lazySteps: list):
+    if "name" not in menu:
+        print(f"ERROR: Layout menu without name: {menu}")
+        return
+    name = f"{base}.{menu['name']}"
+    steps = lazySteps if lazy else core
+    steps.append([MENU, name, None, menu.get("properties", {}), None, GEOMETRY_NONE, None])
+    for element in menu.get("elements", []):
+        _compileMenuElement(element, name, steps)
+
+
+def _compileMenuElement(element: dict, base: str, steps: list):
+    kinds = {"cascade": CASCADE, "separator": SEPARATOR, "command": COMMAND}
+    if "name" not in element or str(element.get("type", "")).lower() not in kinds:
+        print(f"ERROR: Layout menu element without name or with unknown type in {base}: {element}")
+        return
+    name = f"{base}.{element['name']}"
+    kind = kinds[element["type"].lower()]
+    if kind == CASCADE:
+        steps.append([kind, name, base, element.get("menuProperties", {}), element.get("properties", {}),
+                      GEOMETRY_NONE, None])
+    else:
+        steps.append([kind, name, base, element.get("properties", {}), None, GEOMETRY_NONE, None])
+    for subElement in element.get("elements", []):
+        _compileMenuElement(subElement, name, steps)
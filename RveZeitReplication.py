@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# replication of the captured times between the stations
+import json
+import queue
+import socket
+import sqlite3
+import threading
+
+import RveZeitConfig
+import RveZeitDB
+
+
+class Replication:
+    """
+    Exchanges the changes of zeiten between the stations over TCP.
+    Every station with REPLICATION.Port publishes its changelog: a peer connects,
+    tells the last sequence number it knows and gets all later changes, then every
+    new change within REPLICATION.Interval ms.
+    The stations in REPLICATION.Peers are subscribed; their changes are written to
+    the mirror table of the database by processEvents().
+
+    Protocol, one JSON object per line:
+        publisher:  {"station": "Start", "hello": <last seq>}
+        subscriber: {"since": <seq known by the subscriber>}
+        publisher:  {"station": "Start", "reset": true}  (database of the station was replaced)
+                    {"station": "Start", "changes": [[seq, nummer, op, secToday, race], ...]}
+                    {"station": "Start"}  (heartbeat)
+    """
+
+    # seconds between heartbeats, a connection without any line for 3 heartbeats is dead
+    __heartbeat = 5
+    # seconds to wait before a lost peer is connected again
+    __reconnect = 2
+
+    def __init__(self, config: RveZeitConfig, db: RveZeitDB):
+        self.__config = config
+        self.__db = db
+        self.__position = config.get("data.Position")
+        self.__sqliteFile = config.get("data.SQLiteFile")
+        self.__interval = (config.get("replication.Interval") or 200) / 1000
+        self.__events = queue.Queue()
+        self.__stop = threading.Event()
+        self.__server = None
+        # station -> last applied seq, read by the subscriber threads
+        self.__seqs = {}
+
+        port = config.get("replication.Port")
+        if port:
+            try:
+                self.__server = socket.create_server(("", port))
+                self.__server.settimeout(1)
+                threading.Thread(target=self.__serve, name="ReplicationServer", daemon=True).start()
+                print(f"Replication: publish {self.__position} on port {port}")
+            except OSError as e:
+                print(f"ERROR: Replication port {port} can not be opened: {e}")
+                self.__server = None
+        for peer in self.__peers(config.get("replication.Peers")):
+            threading.Thread(target=self.__subscribe, args=peer, name=f"Replication{peer[0]}:{peer[1]}",
+                             daemon=True).start()
+            print(f"Replication: subscribe {peer[0]}:{peer[1]}")
+
+    def close(self):
+        self.__stop.set()
+        if self.__server:
+            self.__server.close()
+            self.__server = None
+
+    def processEvents(self) -> dict:
+        """
+        Write the received changes into the mirror of the database.
+        Has to be called from the thread which owns the database connection.
+        Returns station -> set of the changed numbers of the current race.
+        """
+        changed = {}
+        while True:
+            try:
+                station, changes, reset = self.__events.get_nowait()
+            except queue.Empty:
+                break
+            numbers = changed.setdefault(station, set())
+            if reset:
+                numbers.update(self.__db.getMirrorNumbers(station))
+            self.__db.applyMirror(station, changes, reset)
+            self.__seqs[station] = self.__db.getMirrorSeq(station)
+            race = self.__db.getRace()
+            numbers.update(change[1] for change in changes if (change[4] if len(change) > 4 else 1) == race)
+        return changed
+
+    def __peers(self, peers: str) -> list:
+        result = []
+        for peer in (peers or "").split(","):
+            peer = peer.strip()
+            if not peer:
+                continue
+            host, _, port = peer.rpartition(":")
+            try:
+                result.append((host, int(port)))
+            except ValueError:
+                print(f"ERROR: Replication peer '{peer}' is not host:port")
+        return result
+
+    # == publisher ===========================================================
+    def __serve(self):
+        while not self.__stop.is_set():
+            try:
+                connection, address = self.__server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self.__publish, args=(connection, address),
+                             name=f"ReplicationPublish{address[0]}", daemon=True).start()
+
+    def __publish(self, connection, address):
+        """
+        Send the changes of the own changelog to one subscriber.
+        Uses its own read-only connection, the changelog is only read after the commit.
+        """
+        database = None
+        try:
+            database = sqlite3.connect(f"file:{self.__sqliteFile}?mode=ro", uri=True)
+            cursor = database.cursor()
+            connection.settimeout(3 * self.__heartbeat)
+            stream = connection.makefile("rw", encoding="utf-8", newline="\n")
+            lastSeq = self.__lastSeq(cursor)
+            self.__send(stream, {"station": self.__position, "hello": lastSeq})
+            seq = int(json.loads(stream.readline())["since"])
+            print(f"Replication: {address[0]} subscribed {self.__position} since {seq}")
+            idle = 0
+            while not self.__stop.is_set():
+                lastSeq = self.__lastSeq(cursor)
+                if lastSeq < seq:
+                    self.__send(stream, {"station": self.__position, "reset": True})
+                    seq = 0
+                if lastSeq > seq:
+                    sql = "SELECT MAX(seq), nummer, op, secToday, race_id FROM changelog " \
+                        "WHERE seq > ? AND seq <= ? GROUP BY race_id, nummer ORDER BY 1"
+                    cursor.execute(sql, (seq, lastSeq))
+                    self.__send(stream, {"station": self.__position, "changes": cursor.fetchall()})
+                    seq = lastSeq
+                    idle = 0
+                elif idle >= self.__heartbeat:
+                    self.__send(stream, {"station": self.__position})
+                    idle = 0
+                self.__stop.wait(self.__interval)
+                idle += self.__interval
+        except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+            print(f"Replication: {address[0]} disconnected: {e}")
+        finally:
+            if database:
+                database.close()
+            connection.close()
+
+    def __lastSeq(self, cursor) -> int:
+        cursor.execute("SELECT MAX(seq) FROM changelog")
+        lastSeq = cursor.fetchone()[0]
+        return lastSeq or 0
+
+    def __send(self, stream, message: dict):
+        stream.write(json.dumps(message) + "\n")
+        stream.flush()
+
+    # == subscriber ==========================================================
+    def __subscribe(self, host: str, port: int):
+        """
+        Receive the changes of a peer, connect again after errors.
+        """
+        while not self.__stop.is_set():
+            try:
+                with socket.create_connection((host, port), timeout=3 * self.__heartbeat) as connection:
+                    stream = connection.makefile("rw", encoding="utf-8", newline="\n")
+                    station = json.loads(stream.readline())["station"]
+                    if station == self.__position:
+                        print(f"ERROR: Replication peer {host}:{port} is this station {station}")
+                        return
+                    self.__send(stream, {"since": self.__seqs.get(station, self.__db.getMirrorSeq(station))})
+                    for line in stream:
+                        message = json.loads(line)
+                        if message.get("reset"):
+                            self.__events.put((station, [], True))
+                        if message.get("changes"):
+                            self.__events.put((station, message["changes"], False))
+                        if self.__stop.is_set():
+                            break
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Replication: {host}:{port} not available: {e}")
+            self.__stop.wait(self.__reconnect)
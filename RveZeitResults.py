@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# results: merge the stations Start, 3000m and Ziel into elapsed times
+import argparse
+import bisect
+import glob
+import gzip
+import lzma
+import os
+import shutil
+import sqlite3
+import time
+
+
+class Results:
+    """
+    Joins the times of the stations by nummer and computes the split and total times.
+    The stations are read incrementally: from their database by the sequence number of
+    the changelog, or from the delta files of the delta export.
+    For every station after the first one a leaderboard (elapsed time, nummer) is kept
+    sorted, so ranks are found by bisection.
+    Only the times of one race are read, databases of older versions only have race 1.
+    """
+
+    # order of the stations on the course, the first one is the start
+    stations = ["Start", "3000m", "Ziel"]
+
+    def __init__(self, stations: list = None, race: int = 1):
+        if stations:
+            self.stations = list(stations)
+        self.race = race
+        # position -> {nummer: secToday}
+        self.__times = {position: {} for position in self.stations}
+        # position -> last applied sequence number of the changelog
+        self.__seq = {position: 0 for position in self.stations}
+        # position -> database file, and (mtime, size) of the files when they were read
+        self.__databases = {}
+        self.__fileStates = {}
+        # position -> sorted list of (elapsed, nummer), and nummer -> elapsed
+        self.__boards = {position: [] for position in self.stations[1:]}
+        self.__elapsed = {position: {} for position in self.stations[1:]}
+
+    # == input ===============================================================
+    def addDatabase(self, position: str, sqliteFile: str):
+        """
+        Read the station from its database file, also .db.gz or .db.xz snapshots.
+        """
+        if position not in self.__times:
+            print(f"ERROR: Unknown position {position}")
+            return
+        self.__databases[position] = sqliteFile
+
+    def update(self) -> set:
+        """
+        Read the changes of all databases which were modified since the last call.
+        Returns the changed numbers.
+        """
+        changed = set()
+        for position, sqliteFile in self.__databases.items():
+            state = self.__fileState(sqliteFile)
+            if state is None or state == self.__fileStates.get(position):
+                continue
+            try:
+                changed |= self.__readDatabase(position, sqliteFile)
+                self.__fileStates[position] = state
+            except (sqlite3.Error, OSError, EOFError, lzma.LZMAError) as e:
+                # e.g. a snapshot which is just being uploaded, read again next time
+                print(f"ERROR: Reading {sqliteFile} failed: {e}")
+        return changed
+
+    def applyDelta(self, fileName: str) -> set:
+        """
+        Apply a delta file '<Position>.<seq>.delta'. Deltas which are already contained
+        in the data of the station are skipped. Returns the changed numbers.
+        """
+        changed = set()
+        with open(fileName) as file:
+            header = file.readline().split()
+            if header[:3] != ["#", "RVEZeit", "delta"] or len(header) < 6:
+                print(f"ERROR: {fileName} is no delta file")
+                return changed
+            position, fromSeq, toSeq = header[3], int(header[4]), int(header[5])
+            if len(header) > 6 and int(header[6]) != self.race:
+                return changed
+            if position not in self.__times:
+                print(f"ERROR: Unknown position {position} in {fileName}")
+                return changed
+            if toSeq <= self.__seq[position]:
+                return changed
+            if fromSeq > self.__seq[position]:
+                print(f"WARNING: {fileName} starts after {fromSeq}, changes up to {self.__seq[position]} are known")
+            for line in file:
+                fields = line.split()
+                if len(fields) != 2:
+                    continue
+                nummer = int(fields[0])
+                secToday = None if fields[1] == "-" else self.__parseTime(fields[1])
+                self.__setTime(position, nummer, secToday)
+                changed.add(nummer)
+        self.__seq[position] = toSeq
+        self.__recompute(changed)
+        return changed
+
+    def __fileState(self, sqliteFile: str) -> tuple:
+        """
+        (mtime, size) of the database and its WAL, None if the database does not exist.
+        """
+        try:
+            stat = os.stat(sqliteFile)
+        except OSError:
+            return None
+        try:
+            wal = os.stat(f"{sqliteFile}-wal")
+            walState = (wal.st_mtime_ns, wal.st_size)
+        except OSError:
+            walState = None
+        return (stat.st_mtime_ns, stat.st_size, walState)
+
+    def __readDatabase(self, position: str, sqliteFile: str) -> set:
+        if sqliteFile.endswith(".gz") or sqliteFile.endswith(".xz"):
+            sqliteFile = self.__decompress(sqliteFile)
+        connection = sqlite3.connect(f"file:{sqliteFile}?mode=ro", uri=True)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'changelog'")
+            if cursor.fetchone() is None:
+                # database of an older version without changelog
+                return self.__reload(position, cursor)
+            cursor.execute("SELECT MAX(seq) FROM changelog")
+            lastSeq = cursor.fetchone()[0] or 0
+            if lastSeq < self.__seq[position]:
+                # database was replaced by a new one
+                return self.__reload(position, cursor)
+            sql = "SELECT MAX(seq), nummer, op, secToday FROM changelog " \
+                f"WHERE seq > ?{self.__raceFilter(cursor, 'changelog')} GROUP BY nummer ORDER BY 1"
+            cursor.execute(sql, (self.__seq[position],))
+            changed = set()
+            for seq, nummer, op, secToday in cursor:
+                self.__setTime(position, nummer, None if op == "D" else secToday)
+                changed.add(nummer)
+            self.__seq[position] = lastSeq
+        finally:
+            connection.close()
+        self.__recompute(changed)
+        return changed
+
+    def __reload(self, position: str, cursor) -> set:
+        """
+        Read all times of the station again.
+        """
+        changed = set(self.__times[position])
+        self.__times[position] = {}
+        cursor.execute(f"SELECT nummer, secToday FROM zeiten WHERE 1{self.__raceFilter(cursor, 'zeiten')}")
+        for nummer, secToday in cursor:
+            self.__times[position][nummer] = secToday
+            changed.add(nummer)
+        try:
+            cursor.execute("SELECT MAX(seq) FROM changelog")
+            self.__seq[position] = cursor.fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            self.__seq[position] = 0
+        self.__recompute(changed)
+        return changed
+
+    def __raceFilter(self, cursor, table: str) -> str:
+        """
+        Condition for the race, for tables without race_id only race 1 has rows.
+        """
+        cursor.execute(f"PRAGMA table_info({table})")
+        if "race_id" in [column[1] for column in cursor.fetchall()]:
+            return f" AND race_id = {int(self.race)}"
+        return "" if self.race == 1 else " AND 0"
+
+    def __decompress(self, fileName: str) -> str:
+        """
+        Decompress a database snapshot next to it, returns the name of the copy.
+        """
+        target = f"{fileName[:-3]}.results"
+        opener = gzip.open if fileName.endswith(".gz") else lzma.open
+        with opener(fileName, 'rb') as source, open(f"{target}.tmp", 'wb') as destination:
+            shutil.copyfileobj(source, destination, 65536)
+        os.replace(f"{target}.tmp", target)
+        return target
+
+    def __parseTime(self, timeString: str) -> float:
+        hour, minuten, sekunden = timeString.split(":")
+        return 3600 * int(hour) + 60 * int(minuten) + float(sekunden)
+
+    # == computation =========================================================
+    def __setTime(self, position: str, nummer: int, secToday):
+        if secToday is None:
+            self.__times[position].pop(nummer, None)
+        else:
+            self.__times[position][nummer] = secToday
+
+    def __recompute(self, numbers: set):
+        """
+        Update the elapsed times and the leaderboards of the given numbers.
+        """
+        start = self.__times[self.stations[0]]
+        for position in self.stations[1:]:
+            times = self.__times[position]
+            board = self.__boards[position]
+            elapsedTimes = self.__elapsed[position]
+            for nummer in numbers:
+                old = elapsedTimes.pop(nummer, None)
+                if old is not None:
+                    del board[bisect.bisect_left(board, (old, nummer))]
+                if nummer in start and nummer in times:
+                    # over midnight the difference gets negative
+                    elapsed = round((times[nummer] - start[nummer]) % 86400, 3)
+                    elapsedTimes[nummer] = elapsed
+                    bisect.insort(board, (elapsed, nummer))
+
+    # == output ==============================================================
+    def getResult(self, nummer: int) -> dict:
+        """
+        Times of one number: position -> secToday, and the elapsed times
+        position -> (elapsed, rank) for the stations after the start.
+        """
+        result = {"nummer": nummer}
+        for position in self.stations:
+            result[position] = self.__times[position].get(nummer)
+        for position in self.stations[1:]:
+            elapsed = self.__elapsed[position].get(nummer)
+            if elapsed is not None:
+                result[f"{position}.elapsed"] = elapsed
+                result[f"{position}.rank"] = bisect.bisect_left(self.__boards[position], (elapsed, nummer)) + 1
+        return result
+
+    def getRank(self, nummer: int, position: str = None) -> int:
+        """
+        Rank of the number at the position (default: the finish), None if not timed there.
+        """
+        position = position or self.stations[-1]
+        elapsed = self.__elapsed[position].get(nummer)
+        if elapsed is None:
+            return None
+        return bisect.bisect_left(self.__boards[position], (elapsed, nummer)) + 1
+
+    def getLeaderboard(self, position: str = None) -> list:
+        """
+        Sorted list of (elapsed, nummer) at the position (default: the finish).
+        """
+        return list(self.__boards[position or self.stations[-1]])
+
+    def formatTime(self, seconds) -> str:
+        if seconds is None:
+            return "--:--:--"
+        whole = int(seconds)
+        timeString = f"{str(whole // 3600).zfill(2)}:{str(whole // 60 % 60).zfill(2)}:{str(whole % 60).zfill(2)}"
+        if seconds != whole:
+            timeString = f"{timeString}.{str(int(round((seconds - whole) * 1000))).zfill(3)[:3]}"
+        return timeString
+
+    def formatLeaderboard(self) -> list:
+        """
+        Lines of the finish leaderboard: rank, nummer, split and total time.
+        """
+        split = self.stations[1] if len(self.stations) > 2 else None
+        lines = []
+        for rank, (elapsed, nummer) in enumerate(self.__boards[self.stations[-1]], 1):
+            splitTime = self.__elapsed[split].get(nummer) if split else None
+            lines.append(f"{str(rank).rjust(3)}  {str(nummer).zfill(4)}  "
+                         f"{self.formatTime(splitTime)}  {self.formatTime(elapsed)}")
+        return lines
+
+
+def findDeltas(sources: list) -> list:
+    """
+    Delta files of the sources: .delta files, directories (all *.delta in them) and
+    glob patterns like 'upload/Ziel.*.delta'. Ordered by position and sequence number,
+    so they are applied in the order they were written.
+    """
+    files = set()
+    for source in sources:
+        if os.path.isdir(source):
+            files.update(glob.glob(os.path.join(source, "*.delta")))
+        elif any(character in source for character in "*?["):
+            files.update(fileName for fileName in glob.glob(source) if fileName.endswith(".delta"))
+        elif os.path.exists(source):
+            files.add(source)
+    return sorted(files, key=deltaKey)
+
+
+def deltaKey(fileName: str) -> tuple:
+    """
+    (position, seq) of '<Position>.<seq>.delta', the seq compared as number.
+    """
+    position, _, seq = os.path.basename(fileName)[:-len(".delta")].rpartition(".")
+    try:
+        return (position, int(seq), fileName)
+    except ValueError:
+        return (position, -1, fileName)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the stations into elapsed times.")
+    parser.add_argument("files", nargs="+",
+                        help="<Position>.db (.db.gz, .db.xz) files, <Position>.<seq>.delta files and "
+                             "directories or glob patterns (quoted) in which new delta files are searched")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between updates, 0 = once")
+    parser.add_argument("--race", type=int, default=1, help="race_id of the race")
+    args = parser.parse_args()
+
+    results = Results(race=args.race)
+    deltaSources = []
+    for fileName in args.files:
+        if fileName.endswith(".delta") or os.path.isdir(fileName) or any(c in fileName for c in "*?["):
+            deltaSources.append(fileName)
+        else:
+            results.addDatabase(os.path.basename(fileName).split(".")[0], fileName)
+    applied = set()
+    while True:
+        changed = results.update()
+        # delta files which arrived since the last update
+        for fileName in findDeltas(deltaSources):
+            if fileName not in applied:
+                changed |= results.applyDelta(fileName)
+                applied.add(fileName)
+        if changed:
+            print(time.strftime('%H:%M:%S'))
+            print("\n".join(results.formatLeaderboard()))
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
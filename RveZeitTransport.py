@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# transport of the exported files
+import hashlib
+import http.client
+import os
+import queue
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import RveZeitConfig
+
+
+def create(config: RveZeitConfig):
+    """
+    Create the transport selected by TRANSPORT.Type: ftp (default), directory or http.
+    """
+    transportType = str(config.get("transport.Type") or "ftp").lower()
+    if transportType == "directory":
+        return Directory(config)
+    if transportType == "http":
+        return HttpPost(config)
+    if transportType != "ftp":
+        print(f"ERROR: Unknown TRANSPORT.Type '{transportType}', use ftp.")
+    # imported here, RveZeitFtp itself imports this module
+    import RveZeitFtp
+    return RveZeitFtp.FTP(config)
+
+
+class Transport:
+    """
+    Base class of the transports.
+    Handles the background execution, the concurrent upload of the files of one
+    transfer in a worker pool, the retries and the callbacks to the UI.
+    A backend implements _configured() and _upload() and may extend close().
+    """
+
+    _config = None
+    _blockSize = 65536
+    _name = "Transport"
+
+    def __init__(self, config: RveZeitConfig):
+        self._config = config
+        self.__events = queue.Queue()
+        self.__transfers = []
+        self.__workers = ThreadPoolExecutor(max_workers=config.get("ftp.Workers") or 1,
+                                            thread_name_prefix=f"{self._name}Worker")
+
+    def close(self):
+        """
+        Wait for running transfers.
+        """
+        for transfer in list(self.__transfers):
+            transfer.join()
+        self.__workers.shutdown(wait=True)
+
+    def sendFile(self, files: list, done=None, progress=None) -> bool:
+        """
+        send given files.
+        Without done callback the call waits for the transfer and returns the result.
+        With done callback the transfer runs in the background and the call returns at once.
+        done(result: bool) and progress(file: str, sent: int, size: int) are called by
+        processEvents() in the thread which owns the UI.
+        """
+        print(f"Send {files} via {self._name}")
+        if done is None:
+            result = self.__transfer(files, progress=None)
+            if result:
+                print(f"{self._name} Transfer erfolgreich !")
+            return result
+        transfer = threading.Thread(target=self.__transferInBackground, args=(files, done, progress),
+                                    name=f"{self._name}Transfer", daemon=True)
+        self.__transfers.append(transfer)
+        transfer.start()
+        return True
+
+    def processEvents(self):
+        """
+        Call the progress and done callbacks of the background transfers.
+        Has to be called from the thread which owns the UI.
+        """
+        while True:
+            try:
+                callback, args = self.__events.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+
+    def __transferInBackground(self, files: list, done, progress):
+        result = False
+        try:
+            result = self.__transfer(files, progress)
+        except Exception as e:
+            print(f"ERROR: {self._name} Transfer failed: {e}")
+        if result:
+            print(f"{self._name} Transfer erfolgreich !")
+        self.__events.put((done, (result,)))
+        self.__transfers.remove(threading.current_thread())
+
+    def __transfer(self, files: list, progress) -> bool:
+        """
+        Upload all files concurrently in the worker pool.
+        """
+        if not self._config or not self._configured():
+            return False
+        uploads = [self.__workers.submit(self.__upload, file, progress) for file in files]
+        return all([upload.result() for upload in uploads])
+
+    def __upload(self, file: str, progress) -> bool:
+        """
+        Upload a file with retries.
+        """
+        size = os.path.getsize(file)
+
+        def report(sent: int):
+            if progress:
+                self.__events.put((progress, (file, sent, size)))
+
+        retries = self._config.get("ftp.Retries") or 0
+        for attempt in range(retries + 1):
+            try:
+                self._upload(file, report)
+                return True
+            except Exception as e:
+                print(f"ERROR: {self._name} upload of {file} failed (attempt {attempt + 1}): {e}")
+        return False
+
+    def _checksum(self, file: str) -> str:
+        """
+        Content of the .sha256 sidecar of the file.
+        """
+        checksum = hashlib.sha256()
+        with open(file, 'rb') as fp:
+            for data in iter(lambda: fp.read(self._blockSize), b""):
+                checksum.update(data)
+        return f"{checksum.hexdigest()}  {os.path.basename(file)}\n"
+
+    def _configured(self) -> bool:
+        raise NotImplementedError
+
+    def _upload(self, file: str, report):
+        """
+        Upload one file completely or raise an exception.
+        report(sent: int) has to be called with the number of bytes sent so far.
+        """
+        raise NotImplementedError
+
+
+class Directory(Transport):
+    """
+    Transport into a local or mounted directory (TRANSPORT.Directory).
+    The files are copied to a temporary name and renamed when complete,
+    a .sha256 sidecar is written next to them.
+    """
+
+    _name = "Directory"
+
+    def _configured(self) -> bool:
+        return bool(self._config.get("transport.Directory"))
+
+    def _upload(self, file: str, report):
+        target = os.path.join(self._config.get("transport.Directory"), os.path.basename(file))
+        sent = 0
+        with open(file, 'rb') as source, open(f"{target}.part", 'wb') as destination:
+            for data in iter(lambda: source.read(self._blockSize), b""):
+                destination.write(data)
+                sent += len(data)
+                report(sent)
+            destination.flush()
+            os.fsync(destination.fileno())
+        os.replace(f"{target}.part", target)
+        with open(f"{target}.sha256.part", 'w') as sidecar:
+            sidecar.write(self._checksum(file))
+        os.replace(f"{target}.sha256.part", f"{target}.sha256")
+
+
+class HttpPost(Transport):
+    """
+    Transport by HTTP POST to a collector (TRANSPORT.Url).
+    Every file is posted as body with the headers X-File-Name and X-Sha256.
+    Each worker keeps its connection open for the next files.
+    """
+
+    _name = "HTTP"
+
+    def __init__(self, config: RveZeitConfig):
+        Transport.__init__(self, config)
+        self.__connections = threading.local()
+
+    def _configured(self) -> bool:
+        return bool(self._config.get("transport.Url"))
+
+    def _upload(self, file: str, report):
+        url = urllib.parse.urlsplit(self._config.get("transport.Url"))
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "Content-Length": str(os.path.getsize(file)),
+            "X-File-Name": os.path.basename(file),
+            "X-Sha256": self._checksum(file).split()[0]
+        }
+        connection = self.__connection(url)
+        try:
+            with open(file, 'rb') as fp:
+                connection.request("POST", url.path or "/", body=_ReportingReader(fp, report), headers=headers)
+                response = connection.getresponse()
+                response.read()
+            if response.status >= 300:
+                raise http.client.HTTPException(f"{response.status} {response.reason}")
+        except Exception:
+            # the next try opens a new connection
+            connection.close()
+            self.__connections.connection = None
+            raise
+
+    def __connection(self, url):
+        connection = getattr(self.__connections, "connection", None)
+        if connection is None:
+            connectionClass = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+            connection = connectionClass(url.hostname, url.port, timeout=self._config.get("ftp.Timeout"))
+            self.__connections.connection = connection
+        return connection
+
+
+class _ReportingReader:
+    """
+    File wrapper which reports the number of bytes read, used for the upload progress.
+    """
+
+    def __init__(self, fp, report):
+        self.__fp = fp
+        self.__report = report
+        self.__sent = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.__fp.read(size)
+        self.__sent += len(data)
+        self.__report(self.__sent)
+        return data
@@ -9,6 +9,9 @@ import json
 
 import tkinter as tk
 from tkinter import ttk
+from tkinter import font as tkfont
+
+import RveZeitLayout
 
 
 class UI:
@@ -20,10 +23,22 @@ class UI:
     __config = None
     __baseName = "window"
     __UIElements = {}
+    # tk variables of traced entries, must be kept referenced
+    __variables = {}
+    # values of the rows of plain listboxes, which only show the text of (text, value) rows
+    __rowValues = {}
+    # build plan of the layout (see RveZeitLayout) and the widget of every step
+    __steps = []
+    __widgets = []
+    # first lazy step, None when the lazy steps are built
+    __lazyFrom = None
+    # callbacks which wait for the lazy elements
+    __builtCallbacks = []
 
     def __init__(self, config: dict):
         print("Init UI")
         self.__config = config
+        self.__builtCallbacks = []
         if self.__config is not None:
             self.__createWindow()
 
@@ -31,9 +46,13 @@ class UI:
         self.__UIElements[self.__baseName] = window = tk.Tk()
 
         # integer validation
-        self.__validationInteger = window.register(self.__only_numbers)
-        self.__validationHour = window.register(self.__only_hours)
-        self.__validationMinute = window.register(self.__only_minutes)
+        self.__validations = (window.register(self.__only_numbers),
+                              window.register(self.__only_hours),
+                              window.register(self.__only_minutes))
+        # builders in the order of the kinds in RveZeitLayout
+        self.__builders = (ttk.Label, ttk.Entry, ttk.Button, ttk.Radiobutton, ttk.Frame, ttk.Scrollbar,
+                           tk.Listbox, Timeline, ttk.Combobox, self.__addMenu, tk.Menu, self.__addSeparator,
+                           self.__addCommand)
 
         val = self.__config.getUI("title")
         if val:
@@ -44,198 +63,78 @@ class UI:
         val = self.__config.getUI("resizable")
         if val:
             window.resizable(**val)
-        val = self.__config.getUI("uiElements")
-        if val:
-            for element in val:
-                self.__addUIElement("window", element)
-        val = self.__config.getUI("menu")
-        if val:
-            self.__addMenu("window", val)
-
-    def __addMenu(self, base: str, element: dict):
-        """
-        Add Manin Menu to Window.
-        Calls creation of all subsequent elements in the menu tree
-        """
-        # print(f"Add Menu to {base}: {element}")
-        if base and base in self.__UIElements and element:
-            parent = self.__UIElements[base]
-            if "name" in element:
-                elementName = f"{base}.{element['name']}"
-                properties = {}
-                if "properties" in element:
-                    properties = element["properties"]
-                self.__UIElements[elementName] = tk.Menu(parent, **properties)
-                parent.config(menu=self.__UIElements[elementName])
-                if "elements" in element:
-                    for subElement in element["elements"]:
-                        self.__addMenuElement(elementName, subElement)
-
-    def __addMenuElement(self, base: str, element: dict):
-        """
-        Add a menu element
-        """
-        # print(f"* Add menu element to {base}. Element: {element}")
-        if base and base in self.__UIElements and element:
-            parent = self.__UIElements[base]
-            if "name" in element and "type" in element:
-                elementName = f"{base}.{element['name']}"
-                properties = {}
-                if "properties" in element:
-                    properties = element["properties"]
-                menuProperties = {}
-                if "menuProperties" in element:
-                    menuProperties = element["menuProperties"]
-                type = element["type"].lower()
-                if "cascade" == type:
-                    self.__addSubMenu(parent, elementName, properties, menuProperties)
-                if "separator" == type:
-                    parent.add_separator()
-                if "command" == type:
-                    parent.add_command(**properties)
-
-                if "elements" in element:
-                    for subElement in element["elements"]:
-                        self.__addMenuElement(elementName, subElement)
-
-    def __addSubMenu(self, parent, name: str, properties:  dict = {}, menuProperties: dict = {}):
-        """
-        add an sub menu
-        """
-        # print(f"** Add new Sub Menue {name}")
-        self.__UIElements[name] = tk.Menu(parent, **menuProperties)
-        parent.add_cascade(menu=self.__UIElements[name], **properties)
-
-    def __addUIElement(self, base: str, element: dict):
-        # print(f"Add to {base} new UI Element: {element}")
-        if base and base in self.__UIElements and element:
-            parent = self.__UIElements[base]
-            if "name" in element and "type" in element:
-                elementName = f"{base}.{element['name']}"
-                properties = {}
-                if "properties" in element:
-                    properties = element["properties"]
-                placement = {}
-                if "placement" in element:
-                    placement = element["placement"]
-                pack = {}
-                if "pack" in element:
-                    pack = element["pack"]
-                validation = {}
-                if "validation" in element:
-                    validation = element["validation"]
-
-                if "label" == element["type"].lower():
-                    self.__addLabel(parent, elementName, properties, placement, pack)
-                if "entry" == element["type"].lower():
-                    self.__addEntry(parent, elementName, properties, placement, pack, validation)
-                if "button" == element["type"].lower():
-                    self.__addButton(parent, elementName, properties, placement, pack)
-                if "frame" == element["type"].lower():
-                    self.__addFrame(parent, elementName, properties, placement, pack)
-                if "scrollbar" == element["type"].lower():
-                    self.__addScrollbar(parent, elementName, properties, placement, pack)
-                if "listbox" == element["type"].lower():
-                    self.__addListbox(parent, elementName, properties, placement, pack)
-                if "radiobutton" == element["type"].lower():
-                    self.__addRadioButton(parent, elementName, properties, placement, pack)
-
-                if "uiElements" in element:
-                    for subElement in element["uiElements"]:
-                        self.__addUIElement(elementName, subElement)
-
-    def __addLabel(self, parent, name: str, properties:  dict = {}, placement: dict = {}, pack: dict = {}):
-        """
-        add an label
-        """
-        # print(f"Add new label {name}")
-        self.__UIElements[name] = ttk.Label(parent, **properties)
-        if placement:
-            self.__UIElements[name].place(cnf=placement)
-        if pack:
-            self.__UIElements[name].pack(cnf=pack)
-
-    def __addEntry(self, parent, name: str, properties: dict = {}, placement: dict = {},
-                   pack: dict = {}, validation: dict = {}):
-        """
-        add an entry
+        self.__steps = self.__config.getUI("steps") or []
+        self.__widgets = [None] * len(self.__steps)
+        self.__lazyFrom = self.__config.getUI("lazyFrom")
+        if self.__lazyFrom is None:
+            self.__lazyFrom = len(self.__steps)
+        self.__build(0, self.__lazyFrom)
+
+    def __build(self, first: int, last: int):
         """
-        # print(f"Add new entry {name}")
-        self.__UIElements[name] = ttk.Entry(parent, **properties)
-        if placement:
-            self.__UIElements[name].place(cnf=placement)
-        if pack:
-            self.__UIElements[name].pack(cnf=pack)
-        if validation:
-            maxLength = 0
-            if "length" in validation:
-                maxLength = validation["length"]
-            if "type" in validation:
-                validationType = validation["type"]
-                if "integer" == validationType.lower():
-                    self.__UIElements[name].config(validate='key',
-                                                   validatecommand=(self.__validationInteger, '%S', '%P', maxLength))
-                if "hour" == validationType.lower():
-                    self.__UIElements[name].config(validate='key',
-                                                   validatecommand=(self.__validationHour, '%S', '%P'))
-                if "minute" == validationType.lower():
-                    self.__UIElements[name].config(validate='key',
-                                                   validatecommand=(self.__validationMinute, '%S', '%P'))
-
-    def __addButton(self, parent, name: str, properties: dict = {}, placement: dict = {}, pack: dict = {}):
+        Replay the steps of the build plan from first to last (exclusive).
         """
-        add an button
+        window = self.__UIElements[self.__baseName]
+        steps = self.__steps
+        widgets = self.__widgets
+        builders = self.__builders
+        for index in range(first, last):
+            kind, name, parent, options, extra, geometry, validation = steps[index]
+            parentWidget = window if parent < 0 else widgets[parent]
+            widget = builders[kind](parentWidget, **options)
+            if geometry == RveZeitLayout.GEOMETRY_PLACE:
+                widget.place(cnf=extra)
+            elif geometry == RveZeitLayout.GEOMETRY_PACK:
+                widget.pack(cnf=extra)
+            elif kind == RveZeitLayout.CASCADE:
+                parentWidget.add_cascade(menu=widget, **extra)
+            if validation:
+                command = (self.__validations[validation[0]], '%S', '%P')
+                if validation[0] == 0:
+                    command = command + (validation[1],)
+                widget.config(validate='key', validatecommand=command)
+            widgets[index] = widget
+            if widget is not None:
+                self.__UIElements[name] = widget
+
+    def __buildLazy(self):
         """
-        # print(f"Add new button {name}")
-        self.__UIElements[name] = ttk.Button(parent, **properties)
-        if placement:
-            self.__UIElements[name].place(cnf=placement)
-        if pack:
-            self.__UIElements[name].pack(cnf=pack)
-
-    def __addRadioButton(self, parent, name: str, properties: dict = {}, placement: dict = {}, pack: dict = {}):
+        Build the lazy elements and call the waiting callbacks.
         """
-        add an radio button
+        if self.__lazyFrom is None:
+            return
+        first = self.__lazyFrom
+        self.__lazyFrom = None
+        self.__build(first, len(self.__steps))
+        callbacks = self.__builtCallbacks
+        self.__builtCallbacks = []
+        for callback in callbacks:
+            callback()
+
+    def whenBuilt(self, callback):
         """
-        # print(f"Add new button {name}")
-        self.__UIElements[name] = ttk.Radiobutton(parent, **properties)
-        if placement:
-            self.__UIElements[name].place(cnf=placement)
-        if pack:
-            self.__UIElements[name].pack(cnf=pack)
-
-    def __addFrame(self, parent, name: str, properties: dict = {}, placement: dict = {}, pack: dict = {}):
+        Call callback when the lazy elements are built, at once if they are already built.
         """
-        add an frame
-        """
-        # print(f"Add new frame {name}")
-        self.__UIElements[name] = ttk.Frame(parent, **properties)
-        if placement:
-            self.__UIElements[name].place(cnf=placement)
-        if pack:
-            self.__UIElements[name].pack(cnf=pack)
-
-    def __addScrollbar(self, parent, name: str, properties: dict = {}, placement: dict = {}, pack: dict = {}):
-        """
-        add an scrollbar
-        """
-        # print(f"Add new scrollbar {name}")
-        self.__UIElements[name] = ttk.Scrollbar(parent, **properties)
-        if placement:
-            self.__UIElements[name].place(cnf=placement)
-        if pack:
-            self.__UIElements[name].pack(cnf=pack)
-
-    def __addListbox(self, parent, name: str, properties: dict = {}, placement: dict = {}, pack: dict = {}):
+        if self.__lazyFrom is None:
+            callback()
+        else:
+            self.__builtCallbacks.append(callback)
+
+    def __addMenu(self, parent, **properties):
         """
-        add an listbox
+        Add Manin Menu to Window.
         """
-        # print(f"Add new listbox {name}")
-        self.__UIElements[name] = tk.Listbox(parent, **properties)
-        if placement:
-            self.__UIElements[name].place(cnf=placement)
-        if pack:
-            self.__UIElements[name].pack(cnf=pack)
+        menu = tk.Menu(parent, **properties)
+        parent.config(menu=menu)
+        return menu
+
+    def __addSeparator(self, parent, **properties):
+        parent.add_separator()
+        return None
+
+    def __addCommand(self, parent, **properties):
+        parent.add_command(**properties)
+        return None
 
     def __only_numbers(self, char, text, lenght):
         """
@@ -283,28 +182,70 @@ class UI:
             self.__UIElements[name].entryconfigure(index, values)
 
     def after(self, name: str, delay: int, callback=None):
+        """
+        Call callback after delay ms, returns the id for after_cancel().
+        """
         if name and name in self.__UIElements:
-            self.__UIElements[name].after(delay, callback)
+            return self.__UIElements[name].after(delay, callback)
+        return None
+
+    def after_cancel(self, name: str, afterId):
+        if afterId and name in self.__UIElements:
+            self.__UIElements[name].after_cancel(afterId)
 
     def show(self):
         print("Show UI")
         if self.__baseName in self.__UIElements and self.__UIElements[self.__baseName] is not None:
+            self.showFirstFrame()
             self.__UIElements[self.__baseName].mainloop()
 
+    def showFirstFrame(self):
+        """
+        Draw the window with the elements built so far.
+        The lazy elements are built by the event loop after this frame.
+        """
+        if self.__baseName in self.__UIElements and self.__UIElements[self.__baseName] is not None:
+            self.__UIElements[self.__baseName].update()
+            if self.__lazyFrom is not None:
+                self.__UIElements[self.__baseName].after_idle(self.__buildLazy)
+
     def exit(self):
         print("Exit UI")
         if self.__baseName in self.__UIElements and self.__UIElements[self.__baseName] is not None:
             self.__UIElements[self.__baseName].destroy()
 
+    def onClose(self, func):
+        """
+        Call func without arguments instead of destroying the window when it is closed by the window manager.
+        """
+        if self.__baseName in self.__UIElements and self.__UIElements[self.__baseName] is not None:
+            self.__UIElements[self.__baseName].protocol("WM_DELETE_WINDOW", func)
+
     def insert(self, name: str, index: int, value: str):
         # print(f"Insert into {name} at {index}: {value}")
         if name in self.__UIElements:
-            self.__UIElements[name].insert(index, value)
+            element = self.__UIElements[name]
+            if isinstance(value, tuple) and not isinstance(element, Timeline):
+                values = self.__rowValues.setdefault(name, [])
+                values.insert(len(values) if index == tk.END else int(index), value[1])
+                value = value[0]
+            element.insert(index, value)
+
+    def delete(self, name: str, first: int, last: int = None):
+        # print(f"Delete from {name}: {first} - {last}")
+        if name in self.__UIElements:
+            self.__UIElements[name].delete(first, last)
+            if name in self.__rowValues:
+                values = self.__rowValues[name]
+                first = len(values) - 1 if first == tk.END else int(first)
+                last = first if last is None else len(values) - 1 if last == tk.END else int(last)
+                del values[first:last + 1]
 
     def clear(self, name: str):
         # print(f"Clear values of {name}")
         if name in self.__UIElements:
             self.__UIElements[name].delete(0, tk.END)
+            self.__rowValues.pop(name, None)
 
     def replace(self, name: str, value: str):
         # print(f"Replace value of {name}: {value}")
@@ -318,6 +259,25 @@ class UI:
             return self.__UIElements[name].get()
         return None
 
+    def setValues(self, name: str, values: list):
+        """
+        Set the choices of a combobox.
+        """
+        if name in self.__UIElements:
+            self.__UIElements[name].config(values=values)
+
+    def trace(self, name: str, func):
+        """
+        Call func without arguments whenever the text of the entry changes,
+        by typing as well as by insert, replace or clear.
+        """
+        # print(f"Trace changes of {name}")
+        if name in self.__UIElements:
+            variable = tk.StringVar(self.__UIElements[self.__baseName], self.__UIElements[name].get())
+            variable.trace_add("write", lambda *args: func())
+            self.__UIElements[name].config(textvariable=variable)
+            self.__variables[name] = variable
+
     def bind(self, name: str, sequence: str, func):
         # print(f"Bind function to {name}")
         if name in self.__UIElements:
@@ -330,6 +290,23 @@ class UI:
             lineText = self.__UIElements[name].get("anchor")
         return lineText
 
+    def curvalue(self, name: str):
+        """
+        Value of the selected row of a timeline or of a listbox filled with (text, value) rows.
+        """
+        # print(f"Curvalue for {name}")
+        value = None
+        if name in self.__UIElements:
+            element = self.__UIElements[name]
+            if isinstance(element, Timeline):
+                value = element.selectedValue()
+            elif isinstance(element, tk.Listbox):
+                selection = element.curselection()
+                values = self.__rowValues.get(name, [])
+                if selection and selection[0] < len(values):
+                    value = values[selection[0]]
+        return value
+
     def __str__(self):
         result = []
         for element in self.__UIElements:
@@ -338,3 +315,187 @@ class UI:
                 "type": str(type(self.__UIElements[element]))
             })
         return json.dumps(result, indent=2)
+
+
+class Timeline(tk.Listbox):
+    """
+    Listbox for large lists. The rows are kept in a backing array and only
+    the visible rows are rendered into the listbox.
+    A row is inserted as text or as tuple (text, value), the value of the
+    selected row is returned by selectedValue().
+    Scrolling works with the usual yview / yscrollcommand interface.
+    """
+
+    def __init__(self, parent, **properties):
+        self.__rows = []
+        self.__first = 0
+        self.__visible = 10
+        self.__selected = None
+        self.__yscrollcommand = properties.pop("yscrollcommand", None)
+        tk.Listbox.__init__(self, parent, **properties)
+        self.__lineHeight = tkfont.Font(font=self.cget("font")).metrics("linespace") + 1
+        self.bind("<Configure>", self.__resize)
+        self.bind("<<ListboxSelect>>", self.__select)
+        self.bind("<MouseWheel>", lambda event: self.__scroll(-1 if event.delta > 0 else 1, "units"))
+        self.bind("<Button-4>", lambda event: self.__scroll(-1, "units"))
+        self.bind("<Button-5>", lambda event: self.__scroll(1, "units"))
+        self.bind("<Up>", lambda event: self.__moveSelection(-1))
+        self.bind("<Down>", lambda event: self.__moveSelection(1))
+
+    # -- Listbox interface on the backing array
+    def configure(self, cnf=None, **kw):
+        if isinstance(cnf, dict):
+            kw = {**cnf, **kw}
+            cnf = None
+        if "yscrollcommand" in kw:
+            self.__yscrollcommand = kw.pop("yscrollcommand")
+            self.__updateScrollbar()
+        if cnf is None and not kw:
+            return None
+        return tk.Listbox.configure(self, cnf, **kw)
+
+    config = configure
+
+    def size(self) -> int:
+        return len(self.__rows)
+
+    def insert(self, index, *elements):
+        if index == tk.END:
+            index = len(self.__rows)
+        index = max(0, min(int(index), len(self.__rows)))
+        rows = [element if isinstance(element, tuple) else (element, None) for element in elements]
+        self.__rows[index:index] = rows
+        if self.__selected is not None and self.__selected >= index:
+            self.__selected += len(rows)
+        if index < self.__first:
+            # keep the visible rows in place like the listbox does
+            self.__first += len(rows)
+            self.__updateScrollbar()
+        elif index <= self.__first + self.__visible:
+            self.__render()
+        else:
+            self.__updateScrollbar()
+
+    def delete(self, first, last=None):
+        if first == tk.END:
+            first = len(self.__rows) - 1
+        if last is None:
+            last = first
+        elif last == tk.END:
+            last = len(self.__rows) - 1
+        first, last = int(first), int(last)
+        if first > last or first >= len(self.__rows):
+            return
+        del self.__rows[first:last + 1]
+        count = last - first + 1
+        if self.__selected is not None:
+            if self.__selected > last:
+                self.__selected -= count
+            elif self.__selected >= first:
+                self.__selected = None
+        if last < self.__first:
+            self.__first -= count
+            self.__updateScrollbar()
+        elif first <= self.__first + self.__visible:
+            self.__render()
+        else:
+            self.__updateScrollbar()
+
+    def get(self, first, last=None):
+        if first == "anchor":
+            if self.__selected is None:
+                return ""
+            return self.__rows[self.__selected][0]
+        if first == tk.END:
+            first = len(self.__rows) - 1
+        if last is None:
+            return self.__rows[int(first)][0]
+        if last == tk.END:
+            last = len(self.__rows) - 1
+        return tuple(row[0] for row in self.__rows[int(first):int(last) + 1])
+
+    def curselection(self):
+        return () if self.__selected is None else (self.__selected,)
+
+    def selectedValue(self):
+        if self.__selected is None:
+            return None
+        return self.__rows[self.__selected][1]
+
+    def yview(self, *args):
+        if not args:
+            return self.__fractions()
+        if args[0] == tk.MOVETO:
+            self.yview_moveto(args[1])
+        elif args[0] == tk.SCROLL:
+            self.__scroll(int(args[1]), args[2])
+
+    def yview_moveto(self, fraction):
+        self.__first = int(float(fraction) * len(self.__rows) + 0.5)
+        self.__render()
+
+    def yview_scroll(self, number, what):
+        self.__scroll(int(number), what)
+
+    def see(self, index):
+        index = int(index)
+        if index < self.__first:
+            self.__first = index
+            self.__render()
+        elif index >= self.__first + self.__visible:
+            self.__first = index - self.__visible + 1
+            self.__render()
+
+    # -- rendering
+    def __scroll(self, number: int, what: str):
+        if what == tk.PAGES:
+            number = number * max(1, self.__visible - 1)
+        self.__first += number
+        self.__render()
+        return "break"
+
+    def __moveSelection(self, step: int):
+        if self.__rows:
+            if self.__selected is None:
+                self.__selected = self.__first
+            else:
+                self.__selected = max(0, min(len(self.__rows) - 1, self.__selected + step))
+            self.see(self.__selected)
+            self.__render()
+        return "break"
+
+    def __resize(self, event):
+        visible = max(1, event.height // self.__lineHeight)
+        if visible != self.__visible:
+            self.__visible = visible
+            self.__render()
+
+    def __select(self, event):
+        selection = tk.Listbox.curselection(self)
+        if selection:
+            self.__selected = self.__first + selection[0]
+
+    def __render(self):
+        """
+        Show the visible part of the rows in the listbox.
+        """
+        self.__first = max(0, min(self.__first, len(self.__rows) - self.__visible))
+        tk.Listbox.delete(self, 0, tk.END)
+        visibleRows = self.__rows[self.__first:self.__first + self.__visible + 1]
+        if visibleRows:
+            tk.Listbox.insert(self, 0, *[row[0] for row in visibleRows])
+        if self.__selected is not None and 0 <= self.__selected - self.__first < len(visibleRows):
+            tk.Listbox.selection_set(self, self.__selected - self.__first)
+            tk.Listbox.activate(self, self.__selected - self.__first)
+        self.__updateScrollbar()
+
+    def __fractions(self) -> tuple:
+        if not self.__rows:
+            return (0.0, 1.0)
+        first = self.__first / len(self.__rows)
+        last = min(1.0, (self.__first + self.__visible) / len(self.__rows))
+        return (first, last)
+
+    def __updateScrollbar(self):
+        if self.__yscrollcommand:
+            self.__yscrollcommand(*self.__fractions())
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# cost of one configuration access
+#
+#   python3 bench/config_access.py
+#
+# "dotted walk" is the former Config.get: split the path and walk the nested dicts.
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def dottedWalk(configData: dict, property: str):
+    configData_ = None
+    if property is not None:
+        keyList = property.split(".")
+        configData_ = configData
+        for key in keyList:
+            if key in configData_:
+                configData_ = configData_[key]
+            else:
+                configData_ = None
+    return configData_
+
+
+def main():
+    sys.path.insert(0, PACKAGE)
+    os.chdir(tempfile.mkdtemp())
+    import RveZeitConfig
+    config = RveZeitConfig.Config()
+    configData = json.loads(str(config))
+
+    number = 1000000
+    cases = [
+        ("dotted walk", lambda: dottedWalk(configData, "data.AutoIncrement")),
+        ("get() shim", lambda: config.get("data.AutoIncrement")),
+        ("attribute", lambda: config.data.AutoIncrement),
+    ]
+    print(f"ns per access of data.AutoIncrement, best of 5 x {number}:")
+    for name, case in cases:
+        best = min(timeit.repeat(case, number=number, repeat=5))
+        print(f"  {name:12} {1e9 * best / number:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
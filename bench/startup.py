@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# startup time benchmark: import, config, DB open, first frame, complete UI
+#
+#   python3 bench/startup.py --runs 5 --rows 2000
+#
+# Every run is a new python process in a temporary directory with a database of
+# --rows times, so the imports are cold (apart from the OS file cache).
+# Without display only the stages up to the DB open are measured.
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def once(headless: bool):
+    """
+    Measure one start in the current directory, print the stage times in ms as JSON.
+    """
+    stages = {}
+    start = time.perf_counter()
+
+    def stage(name: str):
+        stages[name] = round(1000 * (time.perf_counter() - start), 1)
+
+    sys.path.insert(0, PACKAGE)
+    import RveZeitConfig
+    import RveZeitDB
+    import RveZeitTransport
+    stage("import")
+    config = RveZeitConfig.Config()
+    stage("config")
+    db = RveZeitDB.DB(config)
+    stage("db open")
+    if not headless and (os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin")):
+        import RveZeitUI
+        import RveZeitApp
+        stage("import ui")
+        ui = RveZeitUI.UI(config)
+        app = RveZeitApp.App(config, ui, db, RveZeitTransport.create(config))
+        app.start()
+        ui.showFirstFrame()
+        stage("first frame")
+        ui.getWidget("window").update()
+        stage("complete")
+        ui.exit()
+    db.close()
+    stages["tkinter loaded"] = "tkinter" in sys.modules
+    print(json.dumps(stages))
+
+
+def prepare(directory: str, rows: int):
+    with open(os.path.join(directory, "RVEZeit.ini"), "w") as file:
+        file.write("[DEFAULT]\nPosition = Bench\n")
+    shutil.copy(os.path.join(PACKAGE, "RVE-Logo.gif"), directory)
+    connection = sqlite3.connect(os.path.join(directory, "Bench.db"))
+    connection.execute("CREATE TABLE zeiten(nummer INTEGER, timeString TEXT, h INTEGER, "
+                       "min INTEGER, sec INTEGER, secToday INTEGER, backup1 INTEGER, backup2 INTEGER, "
+                       "race_id INTEGER NOT NULL DEFAULT 1, PRIMARY KEY (race_id, nummer))")
+    connection.execute("CREATE TABLE meta(nummer INTEGER PRIMARY KEY AUTOINCREMENT, timeString TEXT, "
+                       "h INTEGER, min INTEGER, sec INTEGER, name TEXT, int INTEGER, data TEXT, "
+                       "race_id INTEGER NOT NULL DEFAULT 1)")
+    connection.execute("PRAGMA user_version = 1")
+    connection.executemany("INSERT INTO zeiten VALUES(?, ?, ?, ?, ?, ?, 0, 0, 1)",
+                           ((nummer, "10:00:00", 10, 0, 0, 36000 + nummer) for nummer in range(1, rows + 1)))
+    connection.commit()
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup time of RVE Zeit.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=2000, help="times in the database")
+    parser.add_argument("--headless", action="store_true", help="only the stages without Tk")
+    parser.add_argument("--once", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.once:
+        once(args.headless)
+        return
+
+    results = []
+    for run in range(args.runs):
+        with tempfile.TemporaryDirectory() as directory:
+            prepare(directory, args.rows)
+            command = [sys.executable, os.path.abspath(__file__), "--once"] + (["--headless"] if args.headless else [])
+            output = subprocess.run(command, cwd=directory, capture_output=True, text=True, check=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    print(f"{args.runs} runs, {args.rows} rows, median ms since process start of the benchmark code:")
+    for name in results[0]:
+        values = [result[name] for result in results]
+        if isinstance(values[0], bool):
+            print(f"  {name:15} {values[0]}")
+        else:
+            print(f"  {name:15} {statistics.median(values):8.1f}")
+
+
+if __name__ == "__main__":
+    main()
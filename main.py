@@ -5,24 +5,44 @@ Created on 18.3.2023
 @author: Dr. Ulf Meerwald, Martin Schmidt
 """
 
+import argparse
+
 import RveZeitConfig
 import RveZeitDB
-import RveZeitApp
-import RveZeitUI
-import RveZeitFtp
+import RveZeitTransport
+import RveZeitReplication
 
 
 def main():
+    parser = argparse.ArgumentParser(description="RVE Zeit")
+    parser.add_argument("--headless", action="store_true",
+                        help="capture from stdin or an event file, without user interface")
+    parser.add_argument("--events", help="headless: event file or named pipe instead of stdin")
+    args = parser.parse_args()
+
     config = RveZeitConfig.Config()
 
     print(f"RVE Zeit - {config.get('app.version')}")
 
-    transport = RveZeitFtp.FTP(config)
+    transport = RveZeitTransport.create(config)
     db = RveZeitDB.DB(config)
-    ui = RveZeitUI.UI(config)
-    app = RveZeitApp.App(config, ui, db, transport)
-    app.start()
-    ui.show()
+    replication = RveZeitReplication.Replication(config, db)
+    if args.headless:
+        # Tk is not loaded at all
+        import RveZeitHeadless
+        RveZeitHeadless.Headless(config, db, transport, replication).run(args.events)
+    else:
+        import RveZeitApp
+        import RveZeitUI
+        ui = RveZeitUI.UI(config)
+        app = RveZeitApp.App(config, ui, db, transport, replication)
+        app.start()
+        ui.show()
+    # write pending database operations and settings, also if the window was just closed
+    config.flush()
+    replication.close()
+    db.close()
+    transport.close()
 
 
 if __name__ == "__main__":
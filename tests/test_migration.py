@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# migration of databases of older versions to the race-keyed schema
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import RveZeitConfig
+import RveZeitDB
+
+# schema of the first versions: only zeiten and meta
+BASELINE = [
+    "CREATE TABLE zeiten(nummer INTEGER PRIMARY KEY, timeString TEXT, h INTEGER, min INTEGER, sec INTEGER, "
+    "secToday INTEGER, backup1 INTEGER, backup2 INTEGER)",
+    "CREATE TABLE meta(nummer INTEGER PRIMARY KEY AUTOINCREMENT, timeString TEXT, h INTEGER, min INTEGER, "
+    "sec INTEGER, name TEXT, int INTEGER, data TEXT)",
+    "INSERT INTO zeiten VALUES(7, '10:00:07', 10, 0, 7, 36007, 36005, 0)",
+    "INSERT INTO zeiten VALUES(8, '10:00:08', 10, 0, 8, 36008, 0, 0)",
+    "INSERT INTO meta (timeString, h, min, sec, name, int, data) "
+    "VALUES('10:00:07', 10, 0, 7, 'Change time of', 7, 'from 10:00:05 to 10:00:07')"
+]
+
+# schema before the races: with capture view, changelog and mirror
+MID_SERIES = BASELINE[:2] + [
+    "CREATE VIEW erfassung AS SELECT nummer, timeString, h, min, sec, secToday, '' AS name FROM zeiten",
+    "CREATE TRIGGER erfassung_insert INSTEAD OF INSERT ON erfassung BEGIN "
+    "INSERT INTO meta (timeString, h, min, sec, name, int, data) SELECT NEW.timeString, NEW.h, NEW.min, NEW.sec, "
+    "NEW.name, nummer, 'from ' || timeString || ' to ' || NEW.timeString FROM zeiten WHERE nummer = NEW.nummer; "
+    "INSERT INTO zeiten (nummer, timeString, h, min, sec, secToday, backup1, backup2) "
+    "VALUES (NEW.nummer, NEW.timeString, NEW.h, NEW.min, NEW.sec, NEW.secToday, 0, 0) "
+    "ON CONFLICT(nummer) DO UPDATE SET timeString = excluded.timeString, h = excluded.h, min = excluded.min, "
+    "sec = excluded.sec, secToday = excluded.secToday, backup1 = secToday, backup2 = backup1; END",
+    "CREATE TABLE changelog(seq INTEGER PRIMARY KEY AUTOINCREMENT, nummer INTEGER, op TEXT, timeString TEXT, "
+    "secToday INTEGER)",
+    "CREATE TRIGGER zeiten_changelog_insert AFTER INSERT ON zeiten BEGIN INSERT INTO changelog "
+    "(nummer, op, timeString, secToday) VALUES (NEW.nummer, 'I', NEW.timeString, NEW.secToday); END",
+    "CREATE TRIGGER zeiten_changelog_update AFTER UPDATE ON zeiten BEGIN INSERT INTO changelog "
+    "(nummer, op, timeString, secToday) VALUES (NEW.nummer, 'U', NEW.timeString, NEW.secToday); END",
+    "CREATE TRIGGER zeiten_changelog_delete AFTER DELETE ON zeiten BEGIN INSERT INTO changelog "
+    "(nummer, op, timeString, secToday) VALUES (OLD.nummer, 'D', NULL, NULL); END",
+    "CREATE TABLE mirror(station TEXT, nummer INTEGER, secToday REAL, seq INTEGER, PRIMARY KEY (station, nummer))",
+    "INSERT INTO mirror VALUES('Start', 7, 35000, 3)"
+] + BASELINE[2:]
+
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__cwd = os.getcwd()
+        self.__directory = tempfile.TemporaryDirectory()
+        os.chdir(self.__directory.name)
+        with open("RVEZeit.ini", "w") as file:
+            file.write("[DEFAULT]\nPosition = Ziel\n")
+        self.db = None
+
+    def tearDown(self):
+        if self.db:
+            self.db.close()
+        os.chdir(self.__cwd)
+        self.__directory.cleanup()
+
+    def openOld(self, statements: list):
+        connection = sqlite3.connect("Ziel.db")
+        for sql in statements:
+            connection.execute(sql)
+        connection.commit()
+        connection.close()
+        self.db = RveZeitDB.DB(RveZeitConfig.Config())
+
+    def query(self, sql: str) -> list:
+        connection = sqlite3.connect("Ziel.db")
+        try:
+            return connection.execute(sql).fetchall()
+        finally:
+            connection.close()
+
+    def checkMigrated(self):
+        self.assertEqual(self.query("PRAGMA user_version"), [(1,)])
+        self.assertEqual(self.db.getRace(), 1)
+        self.assertEqual(self.db.getAllData(), [(8, '10:00:08', 10, 0, 8, 36008, 0, 0),
+                                                (7, '10:00:07', 10, 0, 7, 36007, 36005, 0)])
+        self.assertEqual(self.query("SELECT race_id, int FROM meta"), [(1, 7)])
+        self.assertEqual(self.db.getRaces(), [(1, "Rennen 1")])
+
+    def testBaseline(self):
+        self.openOld(BASELINE)
+        self.checkMigrated()
+
+    def testMidSeries(self):
+        self.openOld(MID_SERIES)
+        self.checkMigrated()
+        # the changelog keeps its sequence numbers, the mirror is replicated again
+        self.assertEqual(self.query("SELECT seq, nummer, race_id FROM changelog ORDER BY seq"),
+                         [(1, 7, 1), (2, 8, 1)])
+        self.assertEqual(self.query("SELECT * FROM mirror"), [])
+        self.assertEqual(self.db.getMirrorSeq("Start"), 0)
+
+    def testCaptureAfterMigration(self):
+        self.openOld(MID_SERIES)
+        self.db.upsertDataByNumber("7", "10:01:00", 10, 1, 0, 36060)
+        self.db.setRace(self.db.addRace("Rennen 2"))
+        self.db.upsertDataByNumber("7", "11:00:00", 11, 0, 0, 39600)
+        self.db.flush()
+        self.assertEqual(self.db.getAllData(), [(7, '11:00:00', 11, 0, 0, 39600, 0, 0)])
+        self.db.setRace(1)
+        self.assertEqual(self.db.getDataByNumber("7"), (7, '10:01:00', 10, 1, 0, 36060, 36007, 36005))
+        self.assertEqual(self.query("SELECT race_id, nummer, op FROM changelog WHERE seq > 2 ORDER BY seq"),
+                         [(1, 7, "U"), (2, 7, "I")])
+
+    def testMigratedOnce(self):
+        self.openOld(BASELINE)
+        self.db.close()
+        self.db = RveZeitDB.DB(RveZeitConfig.Config())
+        self.checkMigrated()
+
+    def testRaceListUsesIndex(self):
+        self.openOld(BASELINE)
+        plan = " ".join(row[3] for row in self.query(
+            "EXPLAIN QUERY PLAN SELECT nummer, timeString, h, min, sec, secToday, backup1, backup2 FROM zeiten "
+            "WHERE race_id = 1 ORDER BY secToday desc, nummer"))
+        self.assertIn("zeiten_race_time", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
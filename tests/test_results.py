@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+# results engine: stations read from their databases and delta files
+import os
+import tempfile
+import unittest
+
+import RveZeitConfig
+import RveZeitDB
+import RveZeitExport
+import RveZeitResults
+
+
+class ResultsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__cwd = os.getcwd()
+        self.__directory = tempfile.TemporaryDirectory()
+        os.chdir(self.__directory.name)
+        self.dbs = {}
+        self.results = RveZeitResults.Results(["Start", "3000m", "Ziel"])
+
+    def tearDown(self):
+        for db in self.dbs.values():
+            db.close()
+        os.chdir(self.__cwd)
+        self.__directory.cleanup()
+
+    def station(self, position: str) -> RveZeitDB.DB:
+        if position not in self.dbs:
+            with open("RVEZeit.ini", "w") as file:
+                file.write(f"[DEFAULT]\nPosition = {position}\n")
+            self.dbs[position] = RveZeitDB.DB(RveZeitConfig.Config())
+            self.results.addDatabase(position, f"{position}.db")
+        return self.dbs[position]
+
+    def capture(self, position: str, nummer: int, secToday: float):
+        whole = int(secToday)
+        self.station(position).upsertDataByNumber(str(nummer), RveZeitExport.formatTime(secToday), whole // 3600,
+                                                  whole // 60 % 60, whole % 60, secToday)
+
+    def race(self):
+        # start 10:00:00, boats 1..3 at the finish in the order 2, 3, 1; boat 4 not finished
+        for nummer in (1, 2, 3, 4):
+            self.capture("Start", nummer, 36000 + nummer)
+        self.capture("3000m", 1, 36700)
+        self.capture("3000m", 2, 36650.5)
+        self.capture("Ziel", 1, 37300)
+        self.capture("Ziel", 2, 37100.25)
+        self.capture("Ziel", 3, 37200)
+
+    def testRanking(self):
+        self.race()
+        self.assertEqual(self.results.update(), {1, 2, 3, 4})
+        self.assertEqual(self.results.getLeaderboard(), [(1098.25, 2), (1197, 3), (1299, 1)])
+        self.assertEqual(self.results.getRank(1), 3)
+        self.assertEqual(self.results.getRank(4), None)
+        self.assertEqual(self.results.getRank(1, "3000m"), 2)
+        result = self.results.getResult(2)
+        self.assertEqual((result["3000m.elapsed"], result["3000m.rank"]), (648.5, 1))
+        self.assertEqual(self.results.formatLeaderboard()[0], "  1  0002  00:10:48.500  00:18:18.250")
+
+    def testIncrementalUpdate(self):
+        self.race()
+        self.results.update()
+        # nothing changed: no database is read
+        self.assertEqual(self.results.update(), set())
+        self.capture("Ziel", 1, 37050)
+        self.station("Ziel").deleteDataByNumber("3")
+        self.station("Ziel").flush()
+        self.assertEqual(self.results.update(), {1, 3})
+        self.assertEqual(self.results.getLeaderboard(), [(1049, 1), (1098.25, 2)])
+        self.assertEqual(self.results.getRank(3), None)
+
+    def testOverMidnight(self):
+        self.capture("Start", 5, 86390)
+        self.capture("Ziel", 5, 20.5)
+        self.results.update()
+        self.assertEqual(self.results.getLeaderboard(), [(30.5, 5)])
+
+    def testReplacedDatabase(self):
+        self.race()
+        self.results.update()
+        self.dbs.pop("Ziel").close()
+        os.remove("Ziel.db")
+        self.capture("Ziel", 4, 37000)
+        self.station("Ziel").flush()
+        self.assertEqual(self.results.update(), {1, 2, 3, 4})
+        self.assertEqual(self.results.getLeaderboard(), [(996, 4)])
+
+    def testCompressedSnapshot(self):
+        self.race()
+        results = RveZeitResults.Results(["Start", "3000m", "Ziel"])
+        for position, db in self.dbs.items():
+            results.addDatabase(position, db.exportSnapshot("gzip"))
+        results.update()
+        self.assertEqual(results.getLeaderboard(), [(1098.25, 2), (1197, 3), (1299, 1)])
+
+    def testDelta(self):
+        self.race()
+        ziel = self.station("Ziel")
+        results = RveZeitResults.Results(["Start", "3000m", "Ziel"])
+        results.addDatabase("Start", "Start.db")
+        results.update()
+        first = RveZeitExport.writeDeltaFile(ziel, "Ziel", 0, ziel.getLastChange())
+        self.assertEqual(results.applyDelta(first), {1, 2, 3})
+        self.assertEqual(results.getLeaderboard(), [(1098.25, 2), (1197, 3), (1299, 1)])
+        # a delta which is already contained is skipped
+        self.assertEqual(results.applyDelta(first), set())
+        fromSeq = ziel.getLastChange()
+        self.capture("Ziel", 3, 37000)
+        ziel.deleteDataByNumber("1")
+        second = RveZeitExport.writeDeltaFile(ziel, "Ziel", fromSeq, ziel.getLastChange())
+        self.assertEqual(results.applyDelta(second), {1, 3})
+        self.assertEqual(results.getLeaderboard(), [(997, 3), (1098.25, 2)])
+
+    def testFindDeltas(self):
+        os.mkdir("upload")
+        for fileName in ("Ziel.9.delta", "Start.000012.delta", "Ziel.10.delta", "Ziel.db"):
+            open(os.path.join("upload", fileName), "w").close()
+        self.assertEqual([os.path.basename(f) for f in RveZeitResults.findDeltas(["upload"])],
+                         ["Start.000012.delta", "Ziel.9.delta", "Ziel.10.delta"])
+        self.assertEqual([os.path.basename(f) for f in RveZeitResults.findDeltas(["upload/Ziel.*"])],
+                         ["Ziel.9.delta", "Ziel.10.delta"])
+        # a delta which arrived later is found by the next scan
+        open(os.path.join("upload", "Ziel.11.delta"), "w").close()
+        self.assertEqual(os.path.basename(RveZeitResults.findDeltas(["upload"])[-1]), "Ziel.11.delta")
+
+    def testRaces(self):
+        self.race()
+        start = self.station("Start")
+        ziel = self.station("Ziel")
+        for db in (start, ziel):
+            db.setRace(db.addRace("Rennen 2"))
+        self.capture("Start", 1, 40000)
+        self.capture("Ziel", 1, 40500)
+        ziel.flush()
+        self.results.update()
+        self.assertEqual(self.results.getLeaderboard(), [(1098.25, 2), (1197, 3), (1299, 1)])
+        results = RveZeitResults.Results(["Start", "3000m", "Ziel"], race=2)
+        results.addDatabase("Start", "Start.db")
+        results.addDatabase("Ziel", "Ziel.db")
+        results.update()
+        self.assertEqual(results.getLeaderboard(), [(500, 1)])
+        # deltas of another race are ignored
+        delta = RveZeitExport.writeDeltaFile(ziel, "Ziel", 0, ziel.getLastChange())
+        self.assertEqual(self.results.applyDelta(delta), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
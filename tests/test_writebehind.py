@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18.3.2023
+@author: Dr. Ulf Meerwald, Martin Schmidt
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import RveZeitConfig
+import RveZeitDB
+
+
+class WriteBehindTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__cwd = os.getcwd()
+        self.__directory = tempfile.TemporaryDirectory()
+        os.chdir(self.__directory.name)
+        with open("RVEZeit.ini", "w") as file:
+            file.write("[DEFAULT]\nPosition = Ziel\n[DB]\nWriteBehind = True\n")
+        self.db = RveZeitDB.DB(RveZeitConfig.Config())
+
+    def tearDown(self):
+        self.db.close()
+        os.chdir(self.__cwd)
+        self.__directory.cleanup()
+
+    def waitForWriter(self):
+        # committed by the writer thread, the acknowledgement is not processed yet
+        connection = sqlite3.connect("Ziel.db")
+        deadline = time.monotonic() + 5
+        while not connection.execute("SELECT COUNT(*) FROM changelog").fetchone()[0] \
+                and time.monotonic() < deadline:
+            time.sleep(0.01)
+        connection.close()
+
+    def testOwnCommitsKeepIndex(self):
+        self.db.upsertDataByNumber("1", "10:00:00", 10, 0, 0, 36000)
+        self.waitForWriter()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertTrue(self.db.hasNumber("1"))
+        self.assertNotIn("reload index", output.getvalue())
+
+    def testCloseWithoutCallbacks(self):
+        # after the main loop the callbacks of the user interface must not run anymore
+        called = []
+        self.db.upsertDataByNumber("2", "10:00:01", 10, 0, 1, 36001, callback=lambda: called.append(True))
+        self.db.close()
+        self.assertEqual(called, [])
+        connection = sqlite3.connect("Ziel.db")
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM zeiten").fetchone()[0], 1)
+        connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()